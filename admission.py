@@ -0,0 +1,87 @@
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Optional
+
+
+class QueueFull(Exception):
+    """Raised when the waiting line is already at its maximum depth."""
+
+
+class _Waiter:
+    def __init__(self):
+        self.granted = asyncio.get_running_loop().create_future()
+        self.moved = asyncio.Event()
+
+
+class AdmissionQueue:
+    """
+    FIFO admission control for expensive work (compiles, runs).
+
+    At most `slots` jobs hold a slot at once; up to `max_waiting` more wait in
+    line and are told their position every time it changes. Anything beyond
+    that is rejected straight away with QueueFull.
+    """
+
+    def __init__(self, slots: int, max_waiting: int):
+        self.slots = max(1, slots)
+        self.max_waiting = max_waiting
+        self.active = 0
+        self._waiting = deque()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiting)
+
+    async def acquire(self, on_position: Optional[Callable[[int], Awaitable[None]]] = None):
+        if self.active < self.slots and not self._waiting:
+            self.active += 1
+            return
+        if len(self._waiting) >= self.max_waiting:
+            raise QueueFull()
+
+        waiter = _Waiter()
+        self._waiting.append(waiter)
+        reported = None
+        try:
+            while not waiter.granted.done():
+                waiter.moved.clear()
+                position = self._waiting.index(waiter) + 1
+                if on_position and position != reported:  # someone behind us leaving changes nothing
+                    reported = position
+                    await on_position(position)
+                if waiter.granted.done():
+                    break
+                moved = asyncio.ensure_future(waiter.moved.wait())
+                try:
+                    await asyncio.wait({waiter.granted, moved}, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    moved.cancel()
+        except BaseException:
+            if waiter in self._waiting:
+                self._waiting.remove(waiter)
+                self._notify_moved()
+            elif waiter.granted.done():
+                # The slot was handed to us just as we gave up; pass it on
+                self.release()
+            raise
+
+    def release(self):
+        if self._waiting:
+            # Hand the slot straight to the head of the line (active stays the same)
+            self._waiting.popleft().granted.set_result(None)
+            self._notify_moved()
+        else:
+            self.active -= 1
+
+    def _notify_moved(self):
+        for waiter in self._waiting:
+            waiter.moved.set()
+
+    @asynccontextmanager
+    async def slot(self, on_position: Optional[Callable[[int], Awaitable[None]]] = None):
+        await self.acquire(on_position)
+        try:
+            yield
+        finally:
+            self.release()
@@ -0,0 +1,323 @@
+import re
+from bisect import bisect_right
+from typing import Iterator, List, NamedTuple, Optional
+
+from logic import SenseiLogic
+
+
+class OutlineEntry(NamedTuple):
+    line_no: int      # 1-based, like the editor
+    depth: int        # brace nesting at the start of the line
+    summary: str
+
+
+def brace_delta(line: str) -> int:
+    """Net '{' minus '}' on a line, ignoring a trailing // comment. Rough, but cheap."""
+    code = line.split("//", 1)[0]
+    return code.count("{") - code.count("}")
+
+
+class IncrementalAnalysis:
+    """
+    Per-line explanations for an editor buffer that is re-analyzed on every edit.
+
+    update() diffs the new text against the previous one (common prefix and
+    suffix) and only rescans the lines in between, so a keystroke costs one
+    line of rule matching no matter how big the file is. The outline is rebuilt
+    only when a summary, a brace or the line count actually changed.
+    """
+
+    def __init__(self, logic: SenseiLogic):
+        self.logic = logic
+        self._lines: List[str] = []
+        self._explanations: List[str] = []
+        self._summaries: List[Optional[str]] = []  # rule summary, None for unmatched lines
+        self._deltas: List[int] = []
+        self.outline: List[OutlineEntry] = []
+        self.rescanned = 0  # lines recomputed by the last update()
+
+    def _analyze(self, line: str):
+        found = self.logic.match(line) if line.strip() else None
+        return self.logic.explain_line(line), found.summary if found else None, brace_delta(line)
+
+    def update(self, text: str) -> bool:
+        """Re-analyzes the edited region. Returns True if any explanation or the outline changed."""
+        new = text.split("\n")
+        old = self._lines
+        limit = min(len(old), len(new))
+        start = 0
+        while start < limit and old[start] == new[start]:
+            start += 1
+        tail = 0
+        while tail < limit - start and old[-1 - tail] == new[-1 - tail]:
+            tail += 1
+        old_end, new_end = len(old) - tail, len(new) - tail
+
+        fresh = [self._analyze(line) for line in new[start:new_end]]
+        explanations = [e for e, _, _ in fresh]
+        summaries = [s for _, s, _ in fresh]
+        deltas = [d for _, _, d in fresh]
+
+        changed = explanations != self._explanations[start:old_end]
+        structure_changed = (len(new) != len(old) or summaries != self._summaries[start:old_end]
+                             or deltas != self._deltas[start:old_end])
+
+        self._lines = new
+        self._explanations[start:old_end] = explanations
+        self._summaries[start:old_end] = summaries
+        self._deltas[start:old_end] = deltas
+        self.rescanned = new_end - start
+
+        if structure_changed:
+            outline = self._build_outline()
+            changed = changed or outline != self.outline
+            self.outline = outline
+        return changed
+
+    def _build_outline(self) -> List[OutlineEntry]:
+        entries = []
+        depth = 0
+        for i, summary in enumerate(self._summaries):
+            if summary is not None:
+                # A line that opens with '}' belongs to the outer level
+                closing = self._lines[i].lstrip().startswith("}")
+                entries.append(OutlineEntry(i + 1, max(depth - closing, 0), summary))
+            depth = max(depth + self._deltas[i], 0)
+        return entries
+
+    def explanation_at(self, line_no: int) -> Optional[str]:
+        """Explanation for a 1-based line as of the last update(), or None if out of range."""
+        if 1 <= line_no <= len(self._explanations):
+            return self._explanations[line_no - 1]
+        return None
+
+
+# --- Whole-file analysis -----------------------------------------------------
+
+class Token(NamedTuple):
+    kind: str        # "pp", "ident", "number", "string", "char" or "punct"
+    text: str
+    start: int       # offsets into the source, end exclusive
+    end: int
+    spaced: bool     # whitespace or a comment before it (for rendering statements on one line)
+
+
+# One match per token: the whitespace and comments before it go into `pre`, so
+# the whole file is one linear scan that never looks inside comments. A '#'
+# only appears on directive lines, so it takes the rest of the line with it.
+_TOKEN_RE = re.compile(r"""
+    (?P<pre>(?:\s+|//[^\n]*|/\*[\s\S]*?(?:\*/|\Z))*)
+    (?:
+        (?P<pp>\#(?:[^\n/\\]|/(?![/*])|\\\n|\\)*)
+      | (?P<string>(?:u8|u|U|L)?R"(?P<delim>[^()\\\s]{0,16})\([\s\S]*?\)(?P=delim)"
+                 | (?:u8|u|U|L)?"(?:[^"\\\n]|\\.)*"?)
+      | (?P<char>(?:u8|u|U|L)?'(?:[^'\\\n]|\\.)*'?)
+      | (?P<number>\.?\d(?:[eEpP][+-]|[\w.'])*)
+      | (?P<ident>[A-Za-z_]\w*)
+      | (?P<punct>::|->|<<=|>>=|<<|>>|\+\+|--|&&|\|\||[<>=!+\-*/%&|^]=|.)
+      | \Z   # trailing whitespace or comments, so an unclosed /* isn't backtracked into
+    )
+""", re.VERBOSE)
+
+_PP_SPACE_RE = re.compile(r"^#\s*")
+
+
+def _scan(code: str):
+    """(kind, text, start, end, spaced) tuples; tokenize() without the per-token object."""
+    for m in _TOKEN_RE.finditer(code):
+        kind = m.lastgroup
+        if kind in (None, "pre"):  # only whitespace or comments were left
+            continue
+        if kind == "delim":
+            kind = "string"
+        start = m.start(kind)
+        if kind == "pp":
+            text = m.group(kind).rstrip()
+            yield kind, _PP_SPACE_RE.sub("#", text), start, start + len(text), True
+        else:
+            yield kind, m.group(kind), start, m.end(), m.start() != start
+
+
+def tokenize(code: str) -> Iterator[Token]:
+    """Lightweight C++ tokenizer: skips comments, keeps string literals whole, one pass."""
+    return map(Token._make, _scan(code))
+
+
+class LineIndex:
+    """Offset -> (line, column), both 1-based, by binary search over line starts."""
+
+    def __init__(self, code: str):
+        self.starts = [0] + [m.end() for m in re.finditer("\n", code)]
+
+    def position(self, offset: int):
+        line = bisect_right(self.starts, offset)
+        return line, offset - self.starts[line - 1] + 1
+
+
+class Construct(NamedTuple):
+    kind: str            # "preprocessor", "control", "block", "access" or "statement"
+    line: int
+    column: int
+    end_line: int
+    end_column: int      # column of the construct's last character
+    text: str            # the construct rendered on one line, comments removed
+    scope: str           # enclosing blocks, outermost first, e.g. "class Dog > speak"
+    summary: Optional[str]
+    detail: Optional[str]
+    url: Optional[str]
+
+
+_CONTROL = {"if", "for", "while", "switch"}
+_ACCESS = {"public", "private", "protected"}
+_TYPE_HEADS = {"class", "struct", "namespace", "enum", "union"}
+_BLOCK_AFTER = {")", "const", "override", "final", "noexcept", "else", "do", "try"}
+_PLAIN = {"ident", "number", "string", "char"}
+_SPECIAL_WORDS = _CONTROL | {"else"}
+
+
+def _assigns(stmt: List[Token]) -> bool:
+    """An '=' outside any parentheses: `int a[] = {` opens an initializer, `f(int x = 0) {` doesn't."""
+    depth = 0
+    for tok in stmt:
+        if tok[1] in ("(", "["):
+            depth += 1
+        elif tok[1] in (")", "]"):
+            depth -= 1
+        elif tok[1] == "=" and depth == 0:
+            return True
+    return False
+
+
+def _render(tokens: List[Token]) -> str:
+    parts = [tokens[0][1]]
+    for tok in tokens[1:]:
+        if tok[4]:
+            parts.append(" ")
+        parts.append(tok[1])
+    return "".join(parts)
+
+
+class FileAnalyzer:
+    """
+    Explains a whole file in one pass over its tokens, so constructs that span
+    lines (a long cout chain, an if whose condition wraps) are seen whole and
+    nothing inside comments or string literals is mistaken for code.
+
+    The explanations are SenseiLogic's rule texts. Which rules are tried comes
+    from the construct's leading keyword, so a catch-all like array access
+    can't claim `cout << a[i];`; the match-anywhere rules are the fallback.
+    """
+
+    def __init__(self, logic: SenseiLogic):
+        self.logic = logic
+
+    def _explain(self, kind: str, tokens: list, scope: List[str], memo: dict, lines: LineIndex,
+                 text: str = None) -> Construct:
+        text = text or _render(tokens)
+        key = (kind, text)
+        if key not in memo:
+            memo[key] = self._rule_for(kind, tokens, text)
+        line, column = lines.position(tokens[0][2])
+        end_line, end_column = lines.position(tokens[-1][3] - 1)
+        return Construct(kind, line, column, end_line, end_column, text,
+                         " > ".join(scope), *(memo[key] or (None, None, None)))
+
+    def _rule_for(self, kind: str, tokens: List[Token], text: str):
+        words = text.split(None, 1)[:1] if kind == "preprocessor" else [t[1] for t in tokens]
+        while len(words) > 2 and words[0] == "std" and words[1] == "::":
+            words = words[2:]
+        found = self.logic.match_with(text, self.logic.rule_indices(words[0]))
+        if found is None and kind != "preprocessor":
+            fallback = self.logic.rule_indices(None)
+            for word in set(words[1:]):
+                fallback.extend(self.logic.rule_indices(word))
+            found = self.logic.match_with(text, fallback)
+        return found
+
+    def analyze(self, code: str) -> List[Construct]:
+        """Every construct in the file, in source order. Safe to call from several threads."""
+        lines = LineIndex(code)
+        memo = {}  # the same statement tends to repeat within a file
+        out = []
+        scope = []            # labels of the open blocks
+
+        def explain(kind, tokens, text=None):
+            return self._explain(kind, tokens, scope, memo, lines, text)
+
+        stmt = []             # tokens of the construct being collected
+        depth = 0             # ( and [ nesting inside it
+        init_braces = 0       # { } nesting of an initializer list inside it
+        head = False          # collecting if/for/while/switch up to its closing ')'
+        pending = None        # scope label for a '{' that directly follows a control head
+
+        # Tokens are plain (kind, text, start, end, spaced) tuples here, for speed
+        for tok in _scan(code):
+            kind, text = tok[0], tok[1]
+            if kind in _PLAIN and text not in _SPECIAL_WORDS and not (len(stmt) == 1 and stmt[0][1] == "else"):
+                stmt.append(tok)  # the common case: nothing to decide
+                pending = None
+                continue
+            if kind == "pp":
+                out.append(explain("preprocessor", [tok]))
+                continue
+
+            if depth == 0 and not init_braces:
+                if text == "{":
+                    if not stmt:
+                        scope.append(pending or "block")
+                    elif (stmt[0][1] in _TYPE_HEADS or stmt[-1][1] in _BLOCK_AFTER) \
+                            and not _assigns(stmt):
+                        out.append(explain("block", stmt + [tok]))
+                        scope.append(self._label(stmt))
+                    else:
+                        init_braces = 1  # `int a[] = {1, 2}` or `vector<int> v{1, 2}`
+                        stmt.append(tok)
+                        continue
+                    stmt, head, pending = [], False, None
+                    continue
+                if text in ("}", ";"):
+                    if stmt:
+                        out.append(explain("statement", stmt + [tok] if text == ";" else stmt))
+                    if text == "}" and scope:
+                        scope.pop()
+                    stmt, head, pending = [], False, None
+                    continue
+                if text == ":" and stmt and (stmt[0][1] in ("case", "default") or
+                                             (len(stmt) == 1 and stmt[0][1] in _ACCESS)):
+                    if stmt[0][1] in _ACCESS:
+                        out.append(explain("access", stmt + [tok], stmt[0][1] + ":"))
+                    stmt = []  # switch labels have no rule of their own
+                    continue
+                if len(stmt) == 1 and stmt[0][1] == "else" and text != "if":
+                    stmt = []  # braceless else: explain the statement it guards
+                if text in _CONTROL and (not stmt or (text == "if" and len(stmt) == 1 and stmt[0][1] == "else")):
+                    head = True
+
+            stmt.append(tok)
+            pending = None
+            if text in ("(", "["):
+                depth += 1
+            elif text in (")", "]"):
+                depth = max(depth - 1, 0)
+                if head and depth == 0 and text == ")":
+                    # The head of an if/for/while/switch; its body comes next
+                    out.append(explain("control", stmt))
+                    pending = "else if" if stmt[0][1] == "else" else stmt[0][1]
+                    stmt, head = [], False
+            elif text == "{":
+                init_braces += 1
+            elif text == "}" and init_braces:
+                init_braces -= 1
+
+        if stmt:
+            out.append(explain("statement", stmt))
+        return out
+
+    @staticmethod
+    def _label(stmt: List[Token]) -> str:
+        words = [t[1] for t in stmt]
+        if words[0] in _TYPE_HEADS and len(words) > 1:
+            return f"{words[0]} {words[1]}"
+        if "(" in words:
+            return words[words.index("(") - 1] if words.index("(") else "lambda"
+        return words[0]
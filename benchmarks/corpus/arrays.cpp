@@ -0,0 +1,56 @@
+#include <iostream>
+using namespace std;
+
+const int SIZE = 8;
+
+void swapValues(int& a, int& b) {
+    int temp = a;
+    a = b;
+    b = temp;
+}
+
+void bubbleSort(int arr[], int n) {
+    for (int i = 0; i < n - 1; i++) {
+        for (int j = 0; j < n - i - 1; j++) {
+            if (arr[j] > arr[j + 1]) {
+                swapValues(arr[j], arr[j + 1]);
+            }
+        }
+    }
+}
+
+int main() {
+    int numbers[SIZE];
+    int values[] = {42, 7, 19, 3, 88, 23, 61, 5};
+    int* ptr = values;
+
+    for (int i = 0; i < SIZE; i++) {
+        numbers[i] = *(ptr + i);
+    }
+    bubbleSort(numbers, SIZE);
+
+    cout << "Sorted:";
+    for (int i = 0; i < SIZE; i++) {
+        cout << " " << numbers[i];
+    }
+    cout << endl;
+
+    int n;
+    cin >> n;
+    int* dynamic = new int[n];
+    delete[] dynamic;
+
+    char choice = 'y';
+    bool done = false;
+    float ratio = 0.5f;
+    while (!done) {
+        switch (choice) {
+            case 'y': done = true; break;
+            default: break;
+        }
+    }
+    do {
+        ratio *= 2;
+    } while (ratio < 10);
+    return 0;
+}
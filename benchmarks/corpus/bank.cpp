@@ -0,0 +1,49 @@
+#include <iostream>
+#include <string>
+using namespace std;
+
+class Account {
+private:
+    string owner;
+    double balance;
+
+public:
+    Account(string name, double initial) : owner(name), balance(initial) {}
+
+    virtual void deposit(double amount) {
+        if (amount > 0) {
+            balance += amount;
+        }
+    }
+
+    bool withdraw(double amount) {
+        if (amount > balance) {
+            cout << "Insufficient funds for " << owner << endl;
+            return false;
+        }
+        balance -= amount;
+        return true;
+    }
+
+    double getBalance() const { return balance; }
+    virtual ~Account() {}
+};
+
+class Savings : public Account {
+public:
+    Savings(string name, double initial) : Account(name, initial) {}
+    void deposit(double amount) override {
+        Account::deposit(amount * 1.01);
+    }
+};
+
+int main() {
+    Account* acct = new Savings("Dana", 100.0);
+    acct->deposit(50);
+    if (!acct->withdraw(500)) {
+        cout << "Withdrawal refused" << endl;
+    }
+    cout << "Balance: " << acct->getBalance() << endl;
+    delete acct;
+    return 0;
+}
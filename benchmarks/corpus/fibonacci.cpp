@@ -0,0 +1,20 @@
+#include <iostream>
+using namespace std;
+
+// Recursive Fibonacci, the classic first example
+int fibonacci(int n) {
+    if (n <= 1) {
+        return n;
+    }
+    return fibonacci(n - 1) + fibonacci(n - 2);
+}
+
+int main() {
+    int count = 10;
+    cout << "First " << count << " Fibonacci numbers:" << endl;
+    for (int i = 0; i < count; i++) {
+        cout << fibonacci(i) << " ";
+    }
+    cout << endl;
+    return 0;
+}
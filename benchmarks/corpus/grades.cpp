@@ -0,0 +1,49 @@
+#include <iostream>
+#include <vector>
+#include <map>
+#include <string>
+using namespace std;
+
+struct Student {
+    string name;
+    vector<int> scores;
+};
+
+double average(const vector<int>& scores) {
+    if (scores.empty()) return 0.0;
+    int total = 0;
+    for (int s : scores) {
+        total += s;
+    }
+    return (double)total / scores.size();
+}
+
+char letter(double avg) {
+    if (avg >= 90) return 'A';
+    else if (avg >= 80) return 'B';
+    else if (avg >= 70) return 'C';
+    else if (avg >= 60) return 'D';
+    return 'F';
+}
+
+int main() {
+    vector<Student> students = {
+        {"Ana", {95, 88, 92}},
+        {"Ben", {72, 65, 80}},
+        {"Chloe", {58, 61, 49}},
+    };
+    map<char, int> histogram;
+
+    for (const Student& st : students) {
+        double avg = average(st.scores);
+        char grade = letter(avg);
+        histogram[grade]++;
+        cout << st.name << ": " << avg << " (" << grade << ")" << endl;
+    }
+
+    cout << "Grade counts:" << endl;
+    for (auto& entry : histogram) {
+        cout << entry.first << " -> " << entry.second << endl;
+    }
+    return 0;
+}
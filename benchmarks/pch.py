@@ -0,0 +1,82 @@
+"""
+Median compile time with and without precompiled headers.
+
+    python -m benchmarks.pch [--runs 7]
+
+Every compile gets a unique trailing comment so the binary cache never hits;
+only the PCH differs between the two columns.
+"""
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+
+from compiler import CompileCache, DEFAULT_PCH_SETS
+
+SAMPLES = {
+    "iostream": (
+        "#include <iostream>\n"
+        "using namespace std;\n"
+        "int main() {\n"
+        "    int a, b;\n"
+        "    cin >> a >> b;\n"
+        "    cout << a + b << endl;\n"
+        "    return 0;\n"
+        "}\n"
+    ),
+    "iostream+vector": (
+        "#include <iostream>\n"
+        "#include <vector>\n"
+        "using namespace std;\n"
+        "int main() {\n"
+        "    vector<int> v = {3, 1, 2};\n"
+        "    for (int x : v) cout << x << ' ';\n"
+        "    return 0;\n"
+        "}\n"
+    ),
+    "bits/stdc++.h": (
+        "#include <bits/stdc++.h>\n"
+        "using namespace std;\n"
+        "int main() {\n"
+        "    vector<int> v = {3, 1, 2};\n"
+        "    sort(v.begin(), v.end());\n"
+        "    cout << v[0] << endl;\n"
+        "    return 0;\n"
+        "}\n"
+    ),
+}
+
+
+def median_compile(cache: CompileCache, code: str, runs: int) -> float:
+    times = []
+    for i in range(runs):
+        source = f"{code}// run {i} {time.time_ns()}\n"
+        start = time.perf_counter()
+        result = cache.compile(source)
+        times.append(time.perf_counter() - start)
+        if not result.ok:
+            raise RuntimeError(result.stderr)
+    return statistics.median(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as plain_dir, tempfile.TemporaryDirectory() as pch_dir:
+        plain = CompileCache(cache_dir=plain_dir, pch_sets=())
+        with_pch = CompileCache(cache_dir=pch_dir, pch_sets=DEFAULT_PCH_SETS)
+        print("building precompiled headers...", file=sys.stderr)
+        with_pch.warm_pch()
+
+        print(f"{'program':<18}{'no PCH (s)':>12}{'PCH (s)':>12}{'speedup':>10}")
+        for name, code in SAMPLES.items():
+            before = median_compile(plain, code, args.runs)
+            after = median_compile(with_pch, code, args.runs)
+            print(f"{name:<18}{before:>12.3f}{after:>12.3f}{before / after:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
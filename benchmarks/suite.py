@@ -0,0 +1,256 @@
+"""
+Benchmarks for the explain, HTTP and compile+run paths, checked against a baseline.
+
+    python -m benchmarks.suite [--quick] [--only explain,http,ws]
+                               [--output benchmarks/results.json]
+                               [--baseline benchmarks/baseline.json] [--threshold 0.25]
+                               [--save-baseline]
+
+Everything runs in-process through FastAPI's TestClient (no network, no extra
+services); /ws/run still compiles with the local g++ and runs the programs in
+the sandbox. Each /ws/run request gets a unique trailing comment so it really
+compiles, like a student who just edited their code.
+
+Results go to --output as JSON. If the baseline file exists, every metric is
+compared against it and the exit status is 1 when any of them got worse by
+more than --threshold (0.25 = 25%). Baselines are machine-specific: refresh
+with --save-baseline after an intentional change or on new hardware.
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), "corpus")
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(__file__), "results.json")
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+RUN_PROGRAM = "fibonacci.cpp"
+
+
+def load_corpus():
+    files = {}
+    for path in sorted(glob.glob(os.path.join(CORPUS_DIR, "*.cpp"))):
+        with open(path) as f:
+            files[os.path.basename(path)] = f.read()
+    return files
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def metric(value, unit, better):
+    return {"value": round(value, 6), "unit": unit, "better": better}
+
+
+def best_time(trials, fn):
+    """Fastest of several trials: the least disturbed by whatever else the machine is doing."""
+    best = float("inf")
+    for _ in range(trials):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_explain(corpus, quick):
+    from logic import SenseiLogic
+    from analysis import FileAnalyzer
+
+    lines = [line for code in corpus.values() for line in code.split("\n") if line.strip()]
+    repeat = 10 if quick else 50
+    trials = 3 if quick else 7
+    results = {}
+
+    def explain_all(logic):
+        for _ in range(repeat):
+            for line in lines:
+                logic.explain_line(line)
+
+    # Uncached: every call scans the rules (what a change to SenseiLogic.rules affects)
+    logic = SenseiLogic(cache_size=0)
+    took = best_time(trials, lambda: explain_all(logic))
+    results["explain_line_uncached"] = metric(repeat * len(lines) / took, "lines/s", "higher")
+
+    # Cached: the server's steady state, where most lines have been seen before
+    logic = SenseiLogic()
+    took = best_time(trials, lambda: explain_all(logic))
+    results["explain_line_cached"] = metric(repeat * len(lines) / took, "lines/s", "higher")
+
+    analyzer = FileAnalyzer(SenseiLogic())
+    source = "\n".join(corpus.values())
+    big = "\n".join([source] * max(1, 10000 // source.count("\n")))
+    took = best_time(trials, lambda: analyzer.analyze(big))
+    results["analyze_file_10k_lines"] = metric(took * 1000, "ms", "lower")
+    return results
+
+
+def bench_http(client, corpus, quick):
+    lines = [line.strip() for code in corpus.values() for line in code.split("\n") if line.strip()]
+    requests = 200 if quick else 1000
+    best = None
+    for _ in range(3 if quick else 5):
+        latencies = []
+        start = time.perf_counter()
+        for i in range(requests):
+            t = time.perf_counter()
+            response = client.post("/explain", json={"line": lines[i % len(lines)]})
+            latencies.append(time.perf_counter() - t)
+            response.raise_for_status()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best[0]:
+            best = (elapsed, latencies)
+    elapsed, latencies = best
+    return {
+        "explain_http_p50": metric(percentile(latencies, 0.50) * 1000, "ms", "lower"),
+        "explain_http_p95": metric(percentile(latencies, 0.95) * 1000, "ms", "lower"),
+        "explain_http_rps": metric(requests / elapsed, "req/s", "higher"),
+    }
+
+
+def run_once(client, code):
+    """One /ws/run session to completion. Returns the latency in seconds."""
+    start = time.perf_counter()
+    with client.websocket_connect("/ws/run") as ws:
+        ws.send_json({"code": code})
+        while True:
+            text = ws.receive_text()
+            if "[Program Finished]" in text:
+                return time.perf_counter() - start
+            if "Compilation Error" in text or "Server busy" in text or "Server Error" in text:
+                raise RuntimeError(text)
+
+
+def bench_ws(client, corpus, quick):
+    program = corpus[RUN_PROGRAM]
+    rounds = 1 if quick else 3
+    results = {}
+    for clients in (1, 8, 32):
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+
+        def worker(n):
+            for r in range(rounds):
+                code = f"{program}// client {n} round {r} {time.time_ns()}\n"
+                try:
+                    took = run_once(client, code)
+                except Exception as e:
+                    with lock:
+                        errors.append(str(e))
+                    continue
+                with lock:
+                    latencies.append(took)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(clients)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+        if errors:
+            raise RuntimeError(f"/ws/run failed with {clients} clients: {errors[0]}")
+
+        results[f"ws_run_{clients}_clients_p50"] = metric(percentile(latencies, 0.50) * 1000, "ms", "lower")
+        results[f"ws_run_{clients}_clients_p95"] = metric(percentile(latencies, 0.95) * 1000, "ms", "lower")
+        results[f"ws_run_{clients}_clients_throughput"] = metric(len(latencies) / elapsed, "runs/s", "higher")
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Prints a comparison table and returns the names of regressed metrics."""
+    regressed = []
+    print(f"\n{'metric':<34}{'baseline':>14}{'now':>14}{'change':>10}")
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<34}{'-':>14}{current['value']:>14.3f}{'new':>10}")
+            continue
+        change = (current["value"] - base["value"]) / base["value"] if base["value"] else 0.0
+        worse = -change if current["better"] == "higher" else change
+        flag = "  REGRESSION" if worse > threshold else ""
+        if flag:
+            regressed.append(name)
+        print(f"{name:<34}{base['value']:>14.3f}{current['value']:>14.3f}{change:>+9.0%}{flag}")
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="fewer iterations, for a smoke test")
+    parser.add_argument("--only", default="explain,http,ws", help="comma-separated groups to run")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    args = parser.parse_args(argv)
+    groups = set(args.only.split(","))
+    corpus = load_corpus()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # A private, empty build cache so earlier runs can't make compiles look free
+        os.environ["SENSEI_BUILD_CACHE"] = cache_dir
+        os.environ["SENSEI_PCH_WARM"] = "0"
+        from fastapi.testclient import TestClient
+        import server
+
+        results = {}
+        if "explain" in groups:
+            print("explain_line / file analyzer...", file=sys.stderr)
+            results.update(bench_explain(corpus, args.quick))
+        with TestClient(server.app) as client:
+            if "http" in groups:
+                print("/explain over HTTP...", file=sys.stderr)
+                results.update(bench_http(client, corpus, args.quick))
+            if "ws" in groups:
+                print("building precompiled headers...", file=sys.stderr)
+                server.build_cache.warm_pch()
+                print("/ws/run at 1, 8 and 32 clients...", file=sys.stderr)
+                results.update(bench_ws(client, corpus, args.quick))
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "compiler": server.build_cache.compiler_version().split("\n")[0],
+            "quick": args.quick,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "metrics": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {args.output}", file=sys.stderr)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"baseline saved to {args.baseline}", file=sys.stderr)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("no baseline yet; run with --save-baseline to create one", file=sys.stderr)
+        for name, current in results.items():
+            print(f"{name:<34}{current['value']:>14.3f} {current['unit']}")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)["metrics"]
+    regressed = compare(results, baseline, args.threshold)
+    if regressed:
+        print(f"\n{len(regressed)} metric(s) regressed by more than {args.threshold:.0%}: {', '.join(regressed)}")
+        return 1
+    print("\nno regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+import re
+from typing import List, NamedTuple, Optional, Sequence
+
+from analysis import FileAnalyzer
+from logic import SenseiLogic
+from sandbox import Usage
+
+LOOP_SCOPES = {"for", "while", "do"}
+FAST_ENOUGH_SECONDS = 0.01  # below this on both builds, a speedup is just noise
+
+# Where a rule looks:
+#   "loop"   statements inside a loop body (and the loop heads themselves)
+#   "param"  each parameter of a function definition
+# Otherwise these are SenseiLogic rules: (pattern, summary, detail, url), with
+# {} filled from the pattern's groups. An optional last pattern, if it matches
+# anywhere in the file, switches the rule off.
+RULES = [
+    ("loop", r'<<\s*(?:std\s*::\s*)?endl\b',
+     "ENDL IN A LOOP: Flushing the output on every pass.",
+     "CONCEPT: 'endl' does two things: it prints a newline AND forces everything buffered so far out to the screen (a flush). Inside a loop that means one trip to the operating system per iteration, which can be most of your running time. \n\nFIX: Print '\\n' instead. The output still appears, and everything is flushed when the program ends.",
+     "https://en.cppreference.com/w/cpp/io/manip/endl"),
+
+    ("loop", r'\bcin\s*>>',
+     "SLOW INPUT: Reading with cin in a loop, still synced with C stdio.",
+     "CONCEPT: By default cin stays in step with C's scanf/printf, so every read goes through an extra layer. For programs that read lots of numbers this is a classic bottleneck. \n\nFIX: Put 'ios::sync_with_stdio(false); cin.tie(nullptr);' at the top of main (and then don't mix cin with scanf).",
+     "https://en.cppreference.com/w/cpp/io/ios_base/sync_with_stdio",
+     r'sync_with_stdio\s*\(\s*(?:false|0)\s*\)'),
+
+    ("param", r'^(?:const\s+)?(?:std\s*::\s*)?(vector|string|map|set|unordered_map|unordered_set|deque|list)\b[^&*]*?\b(\w+)$',
+     "PASS BY VALUE: '{1}' gets a full copy of the {0} on every call.",
+     "CONCEPT: A parameter without '&' is a brand-new copy: every element of the {0} is copied each time the function is called. For big containers (or recursive functions) that copying can cost more than the work itself. \n\nFIX: Take it by reference: 'const {0}<...>& {1}' if the function only reads it, or '{0}<...>& {1}' if it needs to change the caller's {0}.",
+     "https://en.cppreference.com/w/cpp/language/reference"),
+]
+
+
+class Tip(NamedTuple):
+    line: int
+    summary: str
+    detail: str
+    url: str
+
+
+def _parameters(text: str) -> List[str]:
+    """Parameters of a rendered function head like 'int f(vector<int> a, int b) {'."""
+    start = text.find("(")
+    if start < 0:
+        return []
+    params, depth, current = [], 0, []
+    for ch in text[start + 1:]:
+        if ch in "(<[":
+            depth += 1
+        elif ch in ")>]":
+            if depth == 0:  # the closing ')' of the parameter list
+                break
+            depth -= 1
+        elif ch == "," and depth == 0:
+            params.append("".join(current))
+            current = []
+            continue
+        current.append(ch)
+    params.append("".join(current))
+    return [p.split("=")[0].strip() for p in params if p.strip()]
+
+
+class PerformanceCoach:
+    """
+    Points out code patterns that cost performance, with SenseiLogic-style
+    explanations. Works on FileAnalyzer's constructs, so it knows which
+    statements sit inside a loop and never looks inside comments or strings.
+    """
+
+    def __init__(self, analyzer: FileAnalyzer = None, rules=None):
+        self.analyzer = analyzer or FileAnalyzer(SenseiLogic())
+        self.rules = [(where, re.compile(pattern), summary, detail, url,
+                       re.compile(unless[0]) if unless else None)
+                      for where, pattern, summary, detail, url, *unless in (rules or RULES)]
+
+    def tips(self, code: str) -> List[Tip]:
+        """Every tip for this file, in source order."""
+        active = [rule for rule in self.rules if rule[5] is None or not rule[5].search(code)]
+        found = []
+        after_loop_head = False
+        for c in self.analyzer.analyze(code):
+            in_loop = after_loop_head or not LOOP_SCOPES.isdisjoint(c.scope.split(" > "))
+            is_loop_head = c.kind == "control" and c.text.split("(")[0].strip() in LOOP_SCOPES
+            # A braceless loop body is the statement right after the head
+            after_loop_head = is_loop_head
+
+            for where, regex, summary, detail, url, _ in active:
+                if where == "loop" and (in_loop or is_loop_head):
+                    texts = [c.text]
+                elif where == "param" and c.kind == "block" and "(" in c.text:
+                    texts = _parameters(c.text)
+                else:
+                    continue
+                for text in texts:
+                    m = regex.search(text)
+                    if m:
+                        found.append(Tip(c.line, summary.format(*m.groups()), detail.format(*m.groups()), url))
+        return found
+
+
+class Measured(NamedTuple):
+    label: str               # e.g. "-O2"
+    usage: Usage
+    output: str
+
+
+def _seconds(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.3f} s"
+
+
+def _megabytes(kb: Optional[int]) -> str:
+    return "-" if kb is None else f"{kb / 1024:.1f} MB"
+
+
+def speedup(base: Measured, other: Measured) -> Optional[float]:
+    """How many times faster `other` ran (CPU time, wall time where CPU isn't measured)."""
+    a = base.usage.cpu_seconds if base.usage.cpu_seconds is not None else base.usage.wall_seconds
+    b = other.usage.cpu_seconds if other.usage.cpu_seconds is not None else other.usage.wall_seconds
+    if max(a, b) < FAST_ENOUGH_SECONDS:
+        return None
+    return a / max(b, 1e-6)
+
+
+def compare_report(runs: Sequence[Measured], limits=None) -> str:
+    """Side-by-side CPU time, wall time and peak memory, then the speedup of the last build over the first."""
+    width = max(12, *(len(r.label) + 2 for r in runs))
+    rows = [
+        ("", [r.label for r in runs]),
+        ("CPU time", [_seconds(r.usage.cpu_seconds) for r in runs]),
+        ("Wall time", [_seconds(r.usage.wall_seconds) for r in runs]),
+        ("Peak memory", [_megabytes(r.usage.peak_rss_kb) for r in runs]),
+        ("Exit code", [str(r.usage.returncode) for r in runs]),
+    ]
+    lines = [f"{name:<13}" + "".join(f"{v:>{width}}" for v in values) for name, values in rows]
+
+    base, best = runs[0], runs[-1]
+    for r in runs:
+        if r.usage.limit:
+            stopped = r.usage.limit_message(limits) if limits else f"{r.usage.limit} limit"
+            lines.append(f"{r.label} was stopped: {stopped}, so its times are only a lower bound.")
+    factor = speedup(base, best)
+    if factor is None:
+        lines.append("Both builds finished in under 10 ms: too quick to compare. Try a bigger input or more work.")
+    else:
+        lines.append(f"Speedup: {factor:.2f}x at {best.label} compared to {base.label}.")
+    if any(r.output != base.output for r in runs):
+        lines.append("Note: the builds printed different output. That usually means undefined behaviour "
+                     "(an uninitialised variable, reading past the end of an array...).")
+    return "\n".join(lines)
+
+
+def format_tips(tips: Sequence[Tip]) -> str:
+    """Console text for the coach: one line per tip, then each kind of tip explained once."""
+    if not tips:
+        return ""
+    parts = ["Performance coach:"]
+    parts += [f"  Line {tip.line}: {tip.summary}" for tip in tips]
+    explained = set()
+    for tip in tips:
+        if tip.url not in explained:
+            explained.add(tip.url)
+            parts.append(f"\n{tip.detail}\nMore: {tip.url}")
+    return "\n".join(parts)
@@ -0,0 +1,443 @@
+import hashlib
+import os
+import re
+import shutil
+import signal
+import stat
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import NamedTuple, Optional, Sequence
+
+try:
+    import fcntl  # POSIX only; lets several processes share one cache directory
+except ImportError:
+    fcntl = None
+
+
+def per_user(name: str) -> str:
+    """name-<uid>: a fixed name in a shared temp dir could be created first by anyone."""
+    return f"{name}-{os.getuid()}" if hasattr(os, "getuid") else name
+
+
+# Binaries are run straight out of the cache, so it must be ours alone (see private_dir)
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), per_user("sensei-build-cache"))
+# With SENSEI_RUN_UID, programs run as another user who must be able to reach
+# its binary and working directory: search permission only, no listing or writing
+PRIVATE_DIR_MODE = 0o711 if os.environ.get("SENSEI_RUN_UID") else 0o700
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Header sets worth precompiling. A submission gets the largest set that its
+# own leading #includes fully cover, so it never sees a header it didn't ask for.
+# Override with SENSEI_PCH_SETS="bits/stdc++.h;iostream;iostream,vector" ("" disables).
+DEFAULT_PCH_SETS = (
+    ("bits/stdc++.h",),
+    ("iostream",),
+    ("iostream", "string"),
+    ("iostream", "vector"),
+    ("iostream", "string", "vector"),
+    ("iostream", "vector", "algorithm"),
+)
+
+# Lines allowed in the "include prefix": blank, // comments, <system> includes, using namespace std;
+_PREFIX_LINE = re.compile(r'\s*(?:#\s*include\s*<([^>]+)>|using\s+namespace\s+std\s*;)?\s*(?://.*)?$')
+
+# Student code controls what g++ reads: `#include "/dev/zero"` makes cc1plus
+# allocate until it runs out, template recursion can take minutes. Every
+# compiler run gets a time limit and an address-space cap.
+COMPILE_TIMEOUT_SECONDS = float(os.environ.get("SENSEI_COMPILE_TIMEOUT", "30"))
+COMPILE_MEMORY_BYTES = int(os.environ.get("SENSEI_COMPILE_MEMORY_BYTES", 2 * 1024 * 1024 * 1024))
+
+# Entries touched more recently than this are never evicted, so a binary that
+# was just handed out can't vanish before the caller gets to exec it, nor a PCH
+# from under a compile that's still using it.
+EVICTION_GRACE_SECONDS = max(60, 2 * COMPILE_TIMEOUT_SECONDS)
+
+
+class CompileResult(NamedTuple):
+    ok: bool
+    exe: Optional[str]   # path to the binary when ok
+    stderr: str          # compiler output (warnings on success, errors on failure)
+    cached: bool         # True when no compiler was run
+
+
+# What students may pick for a run; anything else is rejected rather than passed to g++
+OPT_LEVELS = ("-O0", "-O2", "-O3")
+STANDARDS = ("c++17", "c++20")
+
+
+def build_flags(opt: str = None, std: str = None) -> tuple:
+    """
+    Compiler flags for a run, e.g. build_flags("O2", "20") -> ("-O2", "-std=c++20").
+    Leaving both out gives () (g++'s defaults) so existing cache entries still hit.
+    Raises ValueError for anything not in OPT_LEVELS / STANDARDS (including non-strings from JSON).
+    """
+    for name, value in (("optimization level", opt), ("standard", std)):
+        if value is not None and not isinstance(value, str):
+            raise ValueError(f"The {name} must be a string, not {value!r}")
+    flags = []
+    if opt:
+        level = "-O" + opt.lstrip("-").lstrip("O")
+        if level not in OPT_LEVELS:
+            raise ValueError(f"Unknown optimization level {opt!r}; use one of {', '.join(OPT_LEVELS)}")
+        flags.append(level)
+    if std:
+        name = "c++" + std.split("=")[-1].replace("c++", "")
+        if name not in STANDARDS:
+            raise ValueError(f"Unknown standard {std!r}; use one of {', '.join(STANDARDS)}")
+        flags.append("-std=" + name)
+    return tuple(flags)
+
+
+def compiler_command(args: Sequence[str]) -> list:
+    """
+    args wrapped so g++ (and the cc1plus/as/ld it starts) runs under the memory
+    cap. The limit is set by a shell that then execs g++, not by preexec_fn,
+    which isn't safe in a process with threads (we compile from pool threads).
+    """
+    if os.name != "posix":
+        return list(args)
+    # ulimit -v takes KiB; if it can't be set the hard limit is already lower, so go on
+    script = f'ulimit -v {COMPILE_MEMORY_BYTES // 1024} 2>/dev/null; exec "$@"'
+    return ["/bin/sh", "-c", script, "sh", *args]
+
+
+def compiler_process_options() -> dict:
+    """
+    Extra Popen/create_subprocess_exec arguments for running compiler_command():
+    its own process group, so kill_compiler() also gets cc1plus/as/ld.
+    """
+    return {"start_new_session": True} if os.name == "posix" else {}
+
+
+def kill_compiler(proc):
+    """Kills a compiler started with compiler_process_options() and everything it started."""
+    if proc.returncode is not None:  # already reaped; its pid may belong to someone else now
+        return
+    try:
+        if os.name == "posix":
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+    except OSError:
+        pass
+
+
+def timeout_message(seconds: float = None) -> str:
+    seconds = COMPILE_TIMEOUT_SECONDS if seconds is None else seconds
+    return f"Compilation took longer than {seconds:g} s and was stopped."
+
+
+def run_compiler(args: Sequence[str], cwd: str = None, timeout: float = None):
+    """
+    Runs g++ with no stdin, under the time and memory limits.
+    Returns (returncode, stderr); a timeout comes back as a failure with a message.
+    """
+    timeout = COMPILE_TIMEOUT_SECONDS if timeout is None else timeout
+    proc = subprocess.Popen(compiler_command(args), cwd=cwd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, text=True, **compiler_process_options())
+    try:
+        _, err = proc.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        kill_compiler(proc)
+        proc.communicate()
+        return -1, timeout_message(timeout)
+    return proc.returncode, err
+
+
+def private_dir(path: str, mode: int = None) -> str:
+    """
+    Creates path if needed and makes sure it's safe to run binaries from: a
+    real directory, owned by this user, that nobody else can write to.
+    Raises PermissionError otherwise rather than using it.
+    """
+    mode = PRIVATE_DIR_MODE if mode is None else mode
+    os.makedirs(path, mode=mode, exist_ok=True)
+    if os.name != "posix":
+        return path
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode):
+        raise PermissionError(f"{path} is not a directory")
+    if st.st_uid != os.getuid():
+        raise PermissionError(f"{path} belongs to another user (uid {st.st_uid}); refusing to use it")
+    if st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise PermissionError(f"{path} is writable by other users; refusing to use it")
+    if stat.S_IMODE(st.st_mode) != mode:
+        os.chmod(path, mode)  # ours, so just tighten (or open up for SENSEI_RUN_UID)
+    return path
+
+
+def pch_sets_from_env():
+    raw = os.environ.get("SENSEI_PCH_SETS")
+    if raw is None:
+        return DEFAULT_PCH_SETS
+    return tuple(tuple(h.strip() for h in group.split(",") if h.strip())
+                 for group in raw.split(";") if group.strip())
+
+
+def include_prefix(code: str) -> frozenset:
+    """System headers #included before the first line of real code."""
+    headers = set()
+    for line in code.splitlines():
+        m = _PREFIX_LINE.match(line)
+        if not m:
+            break
+        if m.group(1):
+            headers.add(m.group(1).strip())
+    return frozenset(headers)
+
+
+class CompileCache:
+    """
+    On-disk cache of compiled binaries keyed by sha256(compiler version, flags, source).
+
+    A hit skips g++ entirely. Concurrent builds of the same key are serialised
+    with a per-key lock (a thread lock plus flock where available), so the
+    first caller compiles and the rest wait and then reuse its binary.
+    The directory is capped at max_bytes with LRU (mtime) eviction.
+
+    Submissions whose include prefix covers one of pch_sets are compiled with
+    a matching precompiled header. PCHs are keyed like binaries (compiler
+    version + flags + headers), so a compiler or flag change simply builds
+    a fresh one. They are built in the background the first time they're
+    missing, and count against max_bytes like binaries (last use = mtime of
+    the pch-* directory), so unused flag combinations get evicted.
+    """
+
+    def __init__(self, cache_dir: str = None, max_bytes: int = None, compiler: str = "g++",
+                 pch_sets=None):
+        self.cache_dir = cache_dir or os.environ.get("SENSEI_BUILD_CACHE", DEFAULT_CACHE_DIR)
+        if max_bytes is None:
+            max_bytes = int(os.environ.get("SENSEI_BUILD_CACHE_BYTES", DEFAULT_MAX_BYTES))
+        self.max_bytes = max_bytes
+        self.compiler = compiler
+        private_dir(self.cache_dir)
+        self._version = None
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self.pch_sets = [frozenset(h) for h in (pch_sets_from_env() if pch_sets is None else pch_sets)]
+        self._pch_building = set()
+
+    def compiler_version(self) -> str:
+        if self._version is None:
+            try:
+                out = subprocess.run([self.compiler, "--version"], capture_output=True, text=True)
+                self._version = out.stdout
+            except OSError:
+                self._version = "unknown"
+        return self._version
+
+    def key(self, code: str, flags: Sequence[str] = ()) -> str:
+        h = hashlib.sha256()
+        for part in (self.compiler, self.compiler_version(), "\0".join(flags), code):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + ".exe")
+
+    def _pch_dir(self, headers: frozenset, flags: Sequence[str]) -> str:
+        key = self.key("\n".join(sorted(headers)), flags)
+        return os.path.join(self.cache_dir, "pch-" + key)
+
+    def pch_for(self, code: str, flags: Sequence[str] = ()) -> Optional[str]:
+        """
+        Path to pass as '-include' for this source, or None. Never blocks on a
+        PCH build: if the right one isn't ready yet, it's started in the
+        background and this compile goes ahead without it.
+        """
+        prefix = include_prefix(code)
+        candidates = [h for h in self.pch_sets if h and h <= prefix]
+        if not candidates:
+            return None
+        headers = max(candidates, key=len)
+        pch_dir = self._pch_dir(headers, flags)
+        header = os.path.join(pch_dir, "pch.h")
+        if os.path.exists(header + ".gch"):
+            self._touch(pch_dir)
+            return header
+        if not os.path.exists(os.path.join(pch_dir, "failed")):
+            self._build_pch_async(headers, tuple(flags))
+        return None
+
+    def warm_pch(self, flags: Sequence[str] = ()):
+        """Builds every configured PCH for these flags (blocking). Handy at startup."""
+        for headers in self.pch_sets:
+            if headers:
+                self._build_pch(headers, tuple(flags))
+
+    def _build_pch_async(self, headers: frozenset, flags: tuple):
+        with self._locks_guard:
+            if (headers, flags) in self._pch_building:
+                return
+            self._pch_building.add((headers, flags))
+
+        def build():
+            try:
+                self._build_pch(headers, flags)
+                self._evict()
+            finally:
+                with self._locks_guard:
+                    self._pch_building.discard((headers, flags))
+
+        threading.Thread(target=build, daemon=True).start()
+
+    def _build_pch(self, headers: frozenset, flags: tuple):
+        pch_dir = self._pch_dir(headers, flags)
+        header = os.path.join(pch_dir, "pch.h")
+        with self._key_lock(os.path.basename(pch_dir)):
+            if os.path.exists(header + ".gch") or os.path.exists(os.path.join(pch_dir, "failed")):
+                return
+            os.makedirs(pch_dir, exist_ok=True)
+            with open(header, "w") as f:
+                f.write("".join(f"#include <{h}>\n" for h in sorted(headers)))
+            tmp = f"{header}.{os.getpid()}.{threading.get_ident()}.tmp"
+            returncode, _ = run_compiler([self.compiler, *flags, "-x", "c++-header", header, "-o", tmp])
+            if returncode == 0:
+                os.replace(tmp, header + ".gch")
+            else:
+                # e.g. bits/stdc++.h on a compiler that doesn't ship it; don't retry
+                open(os.path.join(pch_dir, "failed"), "w").close()
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+
+    def compile(self, code: str, flags: Sequence[str] = ()) -> CompileResult:
+        """Returns a binary for this source, compiling it only if it isn't cached yet."""
+        key = self.key(code, flags)
+        exe = self.path_for(key)
+
+        if os.path.exists(exe):
+            self._touch(exe)
+            return CompileResult(True, exe, "", True)
+
+        with self._key_lock(key):
+            # Someone else may have built it while we were waiting
+            if os.path.exists(exe):
+                self._touch(exe)
+                return CompileResult(True, exe, "", True)
+
+            # Build in a private directory under a fixed name so error messages
+            # say "main.cpp:3:5" rather than pointing into the cache
+            build_dir = tempfile.mkdtemp(prefix=key[:16] + ".", dir=self.cache_dir)
+            try:
+                with open(os.path.join(build_dir, "main.cpp"), "w") as f:
+                    f.write(code)
+                pch = self.pch_for(code, flags)
+                extra = ["-include", pch] if pch else []
+                returncode, stderr = run_compiler([self.compiler, *extra, "main.cpp", "-o", "main.exe", *flags],
+                                                  cwd=build_dir)
+                if returncode != 0:
+                    return CompileResult(False, None, stderr, False)
+                os.replace(os.path.join(build_dir, "main.exe"), exe)  # atomic publish
+            finally:
+                shutil.rmtree(build_dir, ignore_errors=True)
+
+        self._evict()
+        return CompileResult(True, exe, stderr, False)
+
+    @contextmanager
+    def _key_lock(self, key: str):
+        # key -> [lock, threads holding or waiting]; the last one out removes it
+        with self._locks_guard:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                if fcntl is None:
+                    yield
+                    return
+                with open(os.path.join(self.cache_dir, key + ".lock"), "w") as lf:
+                    fcntl.flock(lf, fcntl.LOCK_EX)
+                    try:
+                        yield
+                    finally:
+                        fcntl.flock(lf, fcntl.LOCK_UN)
+        finally:
+            with self._locks_guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[key]
+
+    def _touch(self, path: str):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def remove_stale_builds(self):
+        """
+        Deletes build directories left behind by processes that died mid-compile.
+        Safe while other workers are compiling: only ones older than the grace period go.
+        """
+        now = time.time()
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith("pch-") or not os.path.isdir(path):
+                continue
+            try:
+                if now - os.stat(path).st_mtime > EVICTION_GRACE_SECONDS:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _dir_size(path: str) -> int:
+        total = 0
+        for name in os.listdir(path):
+            try:
+                total += os.stat(os.path.join(path, name)).st_size
+            except OSError:
+                pass
+        return total
+
+    def _evict(self):
+        """Drops least recently used binaries and PCHs until the cache fits in max_bytes."""
+        entries = []
+        total = 0
+        now = time.time()
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if name.endswith(".lock"):
+                # Locks left behind by failed builds have no binary (or PCH) next to them
+                owner = path[:-5]
+                if (not os.path.exists(owner + ".exe") and not os.path.isdir(owner)
+                        and now - st.st_mtime > EVICTION_GRACE_SECONDS):
+                    try: os.remove(path)
+                    except OSError: pass
+                continue
+            if name.startswith("pch-") and os.path.isdir(path):
+                try:
+                    size = self._dir_size(path)
+                except OSError:
+                    continue
+            elif name.endswith(".exe") and len(name) == 68:  # only published <sha256>.exe
+                size = st.st_size
+            else:
+                continue
+            entries.append((st.st_mtime, size, path))
+            total += size
+
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if now - mtime < EVICTION_GRACE_SECONDS:
+                continue
+            try:
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                    lock = path + ".lock"
+                else:
+                    os.remove(path)
+                    lock = path[:-4] + ".lock"
+                total -= size
+                if os.path.exists(lock):
+                    os.remove(lock)
+            except OSError:
+                pass
@@ -0,0 +1,166 @@
+import asyncio
+import json
+import re
+import subprocess
+import threading
+from typing import List, NamedTuple, Optional, Sequence
+
+from compiler import (COMPILE_TIMEOUT_SECONDS, compiler_command, compiler_process_options, kill_compiler,
+                      timeout_message)
+
+# Parse only: no code generation, no linking. Source comes in on stdin.
+SYNTAX_FLAGS = ("-fsyntax-only", "-fdiagnostics-format=json", "-x", "c++", "-")
+
+# The order matters, like SenseiLogic.rules: specific patterns before generic ones.
+# (pattern on the compiler message, friendly tip; '{}' placeholders take the groups)
+TIP_RULES = [
+    (r"expected '?[,;]'?(?: or '?[,;]'?)? before|expected ';'",
+     "You forgot a semicolon (;) at the end of a line. In C++, that's like a period at the end of a sentence."),
+
+    (r"'(cout|cin|endl|string|vector|map|set|cerr)' was not declared in this scope",
+     "'{0}' lives in the standard library's 'std' namespace. Add 'using namespace std;' near the top, or write 'std::{0}'."),
+
+    (r"'(\w+)' was not declared in this scope",
+     "You're using a name ('{}') that the computer doesn't recognize. Did you forget to create the variable first?"),
+
+    (r"expected '}' at end of input",
+     "A '{{' was never closed. Every opening brace needs a matching '}}'."),
+
+    (r"expected '\)'",
+     "A '(' was never closed. Count your brackets: every '(' needs a ')'."),
+
+    (r"missing terminating [\"'] character",
+     "A text or character literal was never closed. Check your quotes."),
+
+    (r"([\w./+-]+): No such file or directory",
+     "The header '{}' doesn't exist. Check the spelling inside #include < >."),
+
+    (r"'(\w+)' does not name a type",
+     "'{}' isn't a type the compiler knows. Is it misspelled, or is a #include missing?"),
+
+    (r"no match for 'operator(<<|>>)'",
+     "C++ doesn't know how to use '{}' with that value. You can only print or read simple types and strings directly."),
+
+    (r"(?:invalid conversion|cannot convert) from",
+     "You're putting a value of one type into a variable of another type that can't hold it."),
+
+    (r"redeclaration of|conflicting declaration",
+     "This name was already declared earlier. Each variable can only be created once per scope."),
+
+    (r"too (few|many) arguments to function",
+     "You called a function with too {} arguments. Compare the call with the function's definition."),
+
+    (r"no return statement in function returning non-void",
+     "This function promises to return a value but never does. Add a 'return' statement."),
+]
+
+_COMPILED_TIPS = [(re.compile(pattern), tip) for pattern, tip in TIP_RULES]
+
+# g++ uses typographic quotes under a UTF-8 locale; the rules are written with plain ones
+_QUOTES = str.maketrans({"\u2018": "'", "\u2019": "'"})
+
+
+class Diagnostic(NamedTuple):
+    kind: str            # "error", "warning", "note" or "fatal error"
+    line: int
+    column: int
+    message: str
+    tip: Optional[str]
+
+
+def timed_out() -> List[Diagnostic]:
+    return [Diagnostic("error", 1, 1, timeout_message(COMPILE_TIMEOUT_SECONDS),
+                       "Checking this code took far too long. Look for an #include of something that isn't a header.")]
+
+
+def friendly_tip(message: str) -> Optional[str]:
+    """First matching tip for a compiler message (or a whole stderr dump)."""
+    message = message.translate(_QUOTES)
+    for regex, tip in _COMPILED_TIPS:
+        match = regex.search(message)
+        if match:
+            try:
+                return tip.format(*match.groups())
+            except IndexError:
+                return tip
+    return None
+
+
+def parse(output: str) -> List[Diagnostic]:
+    """Turns g++'s -fdiagnostics-format=json output into Diagnostics, top-level ones only."""
+    try:
+        entries = json.loads(output or "[]")
+    except ValueError:
+        return []
+    result = []
+    for entry in entries:
+        caret = (entry.get("locations") or [{}])[0].get("caret", {})
+        message = entry.get("message", "")
+        # Notes attached to an error ("suggested alternative: 'std::cout'") help the tip match
+        context = " ".join([message] + [child.get("message", "") for child in entry.get("children", [])])
+        result.append(Diagnostic(entry.get("kind", "error"), caret.get("line", 0),
+                                 caret.get("column", 0), message, friendly_tip(context)))
+    return result
+
+
+class SyntaxChecker:
+    """
+    Blocking syntax checks for callers with their own threads (the Tk IDE).
+    Starting a new check kills the one still in flight; the superseded call
+    returns None so its caller knows to drop the result.
+    """
+
+    def __init__(self, compiler: str = "g++", flags: Sequence[str] = ()):
+        self.compiler = compiler
+        self.flags = tuple(flags)
+        self._lock = threading.Lock()
+        self._proc = None
+        self._generation = 0
+
+    def check(self, code: str) -> Optional[List[Diagnostic]]:
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+            if self._proc is not None:
+                kill_compiler(self._proc)
+            proc = subprocess.Popen(compiler_command([self.compiler, *self.flags, *SYNTAX_FLAGS]),
+                                    stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                    stderr=subprocess.PIPE, text=True, **compiler_process_options())
+            self._proc = proc
+
+        try:
+            _, err = proc.communicate(code, timeout=COMPILE_TIMEOUT_SECONDS)
+        except subprocess.TimeoutExpired:
+            kill_compiler(proc)
+            proc.communicate()
+            err = None
+
+        with self._lock:
+            if self._proc is proc:
+                self._proc = None
+            if generation != self._generation:
+                return None
+        return timed_out() if err is None else parse(err)
+
+
+async def check_async(code: str, compiler: str = "g++", flags: Sequence[str] = ()) -> List[Diagnostic]:
+    """Non-blocking syntax check. Cancelling the awaiting task kills g++."""
+    proc = await asyncio.create_subprocess_exec(
+        *compiler_command([compiler, *flags, *SYNTAX_FLAGS]),
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+        **compiler_process_options(),
+    )
+    try:
+        _, err = await asyncio.wait_for(proc.communicate(code.encode()), COMPILE_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        kill_compiler(proc)
+        await proc.wait()
+        return timed_out()
+    except asyncio.CancelledError:
+        if proc.returncode is None:
+            kill_compiler(proc)
+            await proc.wait()
+        raise
+    return parse(err.decode("utf-8", errors="replace"))
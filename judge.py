@@ -0,0 +1,86 @@
+import difflib
+import math
+from typing import List, NamedTuple, Optional
+
+import sandbox
+
+MAX_REPORTED_OUTPUT = 4096  # characters of program output echoed back per case
+MAX_DIFF_LINES = 40
+
+
+class CaseResult(NamedTuple):
+    index: int
+    verdict: str                 # AC, WA, TLE, MLE, RE, OLE, or OK when there's nothing to compare
+    time: float                  # CPU seconds (wall where CPU time isn't measurable)
+    wall_time: float
+    memory_kb: Optional[int]
+    exit_code: Optional[int]
+    output: str
+    stderr: str
+    diff: Optional[str]
+
+
+def case_limits(time_limit: float, memory_limit_mb: int, base: sandbox.Limits) -> sandbox.Limits:
+    """RLIMIT_CPU only takes whole seconds, so it's rounded up and the exact limit checked afterwards."""
+    return base._replace(
+        cpu_seconds=max(1, math.ceil(time_limit)),
+        wall_seconds=max(time_limit * 3, time_limit + 1),
+        memory_bytes=memory_limit_mb * 1024 * 1024,
+    )
+
+
+def normalize(text: str) -> List[str]:
+    """Judge-style comparison: ignore trailing spaces and trailing blank lines."""
+    lines = [line.rstrip() for line in text.replace("\r\n", "\n").split("\n")]
+    while lines and not lines[-1]:
+        lines.pop()
+    return lines
+
+
+def diff(expected: str, actual: str) -> str:
+    lines = list(difflib.unified_diff(normalize(expected), normalize(actual),
+                                      "expected", "output", lineterm=""))
+    if len(lines) > MAX_DIFF_LINES:
+        lines = lines[:MAX_DIFF_LINES] + ["..."]
+    return "\n".join(lines)
+
+
+def verdict(usage: sandbox.Usage, time_limit: float, memory_limit_mb: int,
+            stderr: str, output: str, expected: Optional[str]) -> str:
+    spent = usage.cpu_seconds if usage.cpu_seconds is not None else usage.wall_seconds
+    if usage.limit in ("cpu", "wall") or spent > time_limit:
+        return "TLE"
+    if (usage.peak_rss_kb is not None and usage.peak_rss_kb > memory_limit_mb * 1024) \
+            or (usage.returncode != 0 and "std::bad_alloc" in stderr):
+        return "MLE"
+    if usage.limit == "output":
+        return "OLE"
+    if usage.returncode != 0:
+        return "RE"
+    if expected is None:
+        return "OK"
+    return "AC" if normalize(output) == normalize(expected) else "WA"
+
+
+def run_case(index: int, exe: str, stdin: str, expected: Optional[str],
+             time_limit: float, memory_limit_mb: int, base: sandbox.Limits,
+             scratch_root: str = None) -> CaseResult:
+    """Runs one test case in its own scratch directory. Blocking; meant for a worker pool."""
+    limits = case_limits(time_limit, memory_limit_mb, base)
+    with sandbox.scratch_dir(scratch_root) as workdir:
+        out, err, usage = sandbox.run(exe, limits, workdir, stdin.encode())
+    output = out.decode("utf-8", errors="replace")
+    errors = err.decode("utf-8", errors="replace")
+
+    result = verdict(usage, time_limit, memory_limit_mb, errors, output, expected)
+    return CaseResult(
+        index=index,
+        verdict=result,
+        time=usage.cpu_seconds if usage.cpu_seconds is not None else usage.wall_seconds,
+        wall_time=usage.wall_seconds,
+        memory_kb=usage.peak_rss_kb,
+        exit_code=usage.returncode,
+        output=output[:MAX_REPORTED_OUTPUT],
+        stderr=errors[:MAX_REPORTED_OUTPUT],
+        diff=diff(expected, output) if result == "WA" else None,
+    )
@@ -1,8 +1,87 @@
-```import re
-from typing import Optional, Tuple, List
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Iterable, Iterator, Optional, Tuple, List, NamedTuple
+
+# Leading literal of a rule pattern (e.g. 'cout', '#include', or 'const' out of
+# r'\b(const)\s+'). Any line the rule can match must contain it, so it doubles
+# as a cheap substring prefilter; _rule_keyword() checks that it really is required.
+_KEYWORD_RE = re.compile(r'(?:\\b)?\(?([#A-Za-z_][\w#]*)(?=[^\w|?*+{]|$)')
+
+
+def _rule_keyword(pattern: str) -> Optional[str]:
+    """
+    The pattern's leading literal, if every match must contain it: not when
+    there's a '|' at the top level (r'foo|bar'), or inside the group the
+    literal opens (r'(foo x|bar)'), or that group is optional (r'(foo)?bar').
+    """
+    kw = _KEYWORD_RE.match(pattern)
+    if not kw:
+        return None
+    in_group = "(" in kw.group(0)
+    depth, i, in_class, group_closed = 0, 0, False, False
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == "\\":
+            i += 2
+            continue
+        if in_class:
+            in_class = ch != "]"
+        elif ch == "[":
+            in_class = True
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+            if in_group and depth == 0 and not group_closed:
+                group_closed = True
+                if pattern[i + 1:i + 2] in ("?", "*") or pattern.startswith("{0", i + 1):
+                    return None
+        elif ch == "|" and (depth == 0 or (in_group and depth == 1 and not group_closed)):
+            return None
+        i += 1
+    return kw.group(1)
+
+
+class RuleMatch(NamedTuple):
+    """Everything the UI needs about a matched line, from a single scan."""
+    summary: str
+    detail: str
+    url: str
+
+
+def _format(text: str, groups: tuple) -> str:
+    # Use strict error handling for formatting to avoid crashes
+    try:
+        return text.format(*groups)
+    except IndexError:
+        return text  # Return raw text if groups don't match placeholders
+
+
+def batch_lines(code: Optional[str] = None,
+                lines: Optional[Iterable[Tuple[int, str]]] = None) -> List[Tuple[int, str]]:
+    """
+    (line_no, text) pairs for a batch of explanations: the given numbered lines,
+    or every line of code (1-based like the editor). Raises ValueError for neither.
+    """
+    if lines is not None:
+        return list(lines)
+    if code is not None:
+        # Same filter the frontend uses: skip blank lines and line comments
+        return [(i + 1, text) for i, text in enumerate(code.split('\n'))
+                if text.strip() and not text.strip().startswith('//')]
+    raise ValueError("Provide either 'code' or 'lines'")
+
 
 class SenseiLogic:
-    def __init__(self):
+    def __init__(self, cache_size: int = 1024):
+        # Memo of line -> match result, bounded with LRU eviction (0 disables it)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.rules_version = 0
+
         # The order matters! Specific rules should generally come before generic ones.
         self.rules = [
             # ==============================================================================
@@ -219,6 +298,104 @@ class SenseiLogic:
              "CONCEPT: POLYMORPHISM. 'Virtual' tells the compiler: 'Don't bind this function call yet. Wait until the program runs to see what kind of object this really is.' This allows a parent pointer to call the child's version of a function.",
              "https://en.cppreference.com/w/cpp/language/virtual"),
         ]
+        self._compile_rules()
+
+    def _compile_rules(self):
+        """
+        Precompiles every pattern and builds a keyword index over them.
+        Rules without a usable keyword are always candidates.
+        Any cached results are dropped since they came from the old table.
+        """
+        self._compiled = []
+        self._keyword_index = {}
+        self._unkeyed = []
+        for i, (pattern, summary, detail, url) in enumerate(self.rules):
+            self._compiled.append((re.compile(pattern), summary, detail, url))
+            kw = _rule_keyword(pattern)
+            if kw:
+                self._keyword_index.setdefault(kw, []).append(i)
+            else:
+                self._unkeyed.append(i)
+        self.rules_version += 1
+        # Same table -> same fingerprint, across restarts and worker processes (for ETags)
+        self.rules_fingerprint = hashlib.sha256(repr(self.rules).encode("utf-8")).hexdigest()[:16]
+        self.clear_cache()
+
+    def set_rules(self, rules: list):
+        """Swaps in a new rule table (same tuple layout as self.rules)."""
+        self.rules = rules
+        self._compile_rules()
+
+    def clear_cache(self):
+        with self._cache_lock:
+            self._cache.clear()
+            self._hits = self._misses = self._evictions = 0
+
+    def cache_stats(self) -> dict:
+        """Counters for sizing the cache under real load."""
+        with self._cache_lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "size": len(self._cache),
+                "max_size": self.cache_size,
+                "rules_version": self.rules_version,
+                "rules_fingerprint": self.rules_fingerprint,
+            }
+
+    def _candidates(self, line: str) -> List[int]:
+        """Rule indices worth trying on this line, in original rule order."""
+        found = list(self._unkeyed)
+        for kw, indices in self._keyword_index.items():
+            if kw in line:
+                found.extend(indices)
+        found.sort()
+        return found
+
+    def match(self, line: str) -> Optional[RuleMatch]:
+        """
+        Single scan over the rules. Returns the first matching rule
+        (same ordering as the rule table) with its texts formatted, or None.
+        """
+        line = line.strip()
+        if self.cache_size <= 0:
+            return self._scan(line)
+
+        with self._cache_lock:
+            if line in self._cache:
+                self._hits += 1
+                self._cache.move_to_end(line)
+                return self._cache[line]
+            self._misses += 1
+
+        found = self._scan(line)
+
+        with self._cache_lock:
+            self._cache[line] = found
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+                self._evictions += 1
+        return found
+
+    def rule_indices(self, keyword: Optional[str] = None) -> List[int]:
+        """Rules whose pattern starts with this keyword, or the unkeyed (match-anywhere) ones for None."""
+        if keyword is None:
+            return list(self._unkeyed)
+        return list(self._keyword_index.get(keyword, ()))
+
+    def match_with(self, text: str, indices: List[int]) -> Optional[RuleMatch]:
+        """Like match(), but only tries the given rules, in table order. Not cached."""
+        return self._scan(text, sorted(indices))
+
+    def _scan(self, line: str, indices: List[int] = None) -> Optional[RuleMatch]:
+        for i in (self._candidates(line) if indices is None else indices):
+            regex, summary, detail, url = self._compiled[i]
+            m = regex.search(line)
+            if m:
+                groups = m.groups()
+                return RuleMatch(_format(summary, groups), _format(detail, groups), url)
+        return None
 
     def explain_line(self, line: str) -> str:
         """
@@ -233,15 +410,10 @@ class SenseiLogic:
                 pass
             else:
                 return "..."
-        
-        for pattern, summary, _, _ in self.rules:
-            match = re.search(pattern, line)
-            if match:
-                # Use strict error handling for formatting to avoid crashes
-                try:
-                    return summary.format(*match.groups())
-                except IndexError:
-                    return summary # Return raw summary if groups don't match placeholders
+
+        found = self.match(line)
+        if found:
+            return found.summary
 
         # Fallback for unsupported lines
         return "Line analysis unsupported. (AI Explanation Available)"
@@ -251,16 +423,20 @@ class SenseiLogic:
         Technical drill-down with documentation link.
         Returns (Description, URL) or None.
         """
-        line = line.strip()
-        for pattern, _, detail, url in self.rules:
-            match = re.search(pattern, line)
-            if match:
-                try:
-                    return (detail.format(*match.groups()), url)
-                except IndexError:
-                    return (detail, url)
+        found = self.match(line)
+        if found:
+            return (found.detail, found.url)
         return None
 
+    def explain_many(self, items: Iterable[Tuple[int, str]]) -> Iterator[dict]:
+        """Yields one result per (line_no, text), running the rule scan once per distinct line."""
+        seen = {}
+        for line_no, text in items:
+            key = text.strip()
+            if key not in seen:
+                seen[key] = self.explain_line(key)
+            yield {"line_no": line_no, "line": key, "explanation": seen[key]}
+
     def get_options(self, line: str) -> List[str]:
         """UI helper to show if 'More Info' is available."""
-        return ['more'] if self.explain_more(line) else []```
+        return ['more'] if self.match(line) else []
@@ -1,9 +1,18 @@
+import codecs
+import queue
 import threading
 import tkinter as tk
 from tkinter import scrolledtext
-import subprocess
-import os
 from logic import SenseiLogic  # Importing the brain
+from analysis import IncrementalAnalysis
+from compiler import CompileCache, OPT_LEVELS, STANDARDS, build_flags
+import sandbox
+import diagnostics
+import coach
+
+DIAGNOSTICS_DELAY_MS = 400  # wait for a pause in typing before checking
+ANALYSIS_DELAY_MS = 150     # explanations only need to catch up once typing pauses
+OUTPUT_POLL_MS = 30         # how often program output is moved from the queue to the console
 
 class SenseiIDE:
     def __init__(self, root):
@@ -11,6 +20,20 @@ class SenseiIDE:
         self.root.title("Sensei: The Learning IDE")
         self.root.geometry("1000x700")
         self.logic = SenseiLogic()
+        self.analysis = IncrementalAnalysis(self.logic)
+        self._analysis_job = None
+        self._shown_explanation = None
+        self._shown_outline = None
+        self.build_cache = CompileCache()
+        self.run_limits = sandbox.Limits.from_env()
+        self.output_queue = queue.Queue()
+        self.current_run = None
+        self._run_generation = 0
+        self._busy_generation = None
+        self._run_lock = threading.Lock()
+        self.checker = diagnostics.SyntaxChecker()
+        self.coach = coach.PerformanceCoach()
+        self._diagnostics_job = None
 
         # --- Top Toolbar ---
         self.toolbar = tk.Frame(root, bg="#eeeeee", height=40)
@@ -20,6 +43,22 @@ class SenseiIDE:
                                  bg="#4CAF50", fg="white", font=("Arial", 10, "bold"))
         self.run_btn.pack(side=tk.LEFT, padx=10, pady=5)
 
+        self.stop_btn = tk.Button(self.toolbar, text="■ Stop", command=self.stop_run,
+                                  bg="#e53935", fg="white", font=("Arial", 10, "bold"))
+        self.stop_btn.pack(side=tk.LEFT, pady=5)
+
+        # Build options: optimization level and C++ standard, used by Run and Compare
+        self.opt_level = tk.StringVar(value=OPT_LEVELS[0])
+        self.standard = tk.StringVar(value="default")
+        tk.Label(self.toolbar, text="Optimize:", bg="#eeeeee").pack(side=tk.LEFT, padx=(20, 2))
+        tk.OptionMenu(self.toolbar, self.opt_level, *OPT_LEVELS).pack(side=tk.LEFT)
+        tk.Label(self.toolbar, text="Standard:", bg="#eeeeee").pack(side=tk.LEFT, padx=(10, 2))
+        tk.OptionMenu(self.toolbar, self.standard, "default", *STANDARDS).pack(side=tk.LEFT)
+
+        self.compare_btn = tk.Button(self.toolbar, text="⚖ Compare", command=self.compare_code,
+                                     bg="#1976d2", fg="white", font=("Arial", 10, "bold"))
+        self.compare_btn.pack(side=tk.LEFT, padx=10, pady=5)
+
         # --- Main Body (Middle) ---
         self.paned_window = tk.PanedWindow(root, orient=tk.HORIZONTAL)
         self.paned_window.pack(fill=tk.BOTH, expand=True)
@@ -27,7 +66,14 @@ class SenseiIDE:
         # Left: Code Editor
         self.editor = scrolledtext.ScrolledText(self.paned_window, width=50, font=("Courier New", 12), undo=True)
         self.paned_window.add(self.editor)
+        # Edits mark the buffer modified and get re-analyzed after a pause;
+        # cursor moves just look up the line's cached explanation
+        self.editor.bind("<<Modified>>", self.on_modified)
         self.editor.bind("<KeyRelease>", self.update_explanation)
+        self.editor.bind("<ButtonRelease-1>", self.update_explanation)
+        self.editor.bind("<KeyRelease>", self.schedule_diagnostics, add="+")
+        self.editor.tag_configure("diag_error", background="#ffd6d6")
+        self.editor.tag_configure("diag_warning", background="#fff3c4")
 
         # Right: Sensei Explanation Panel
         self.tutor_frame = tk.Frame(self.paned_window, bg="white")
@@ -39,82 +85,299 @@ class SenseiIDE:
         self.tutor_panel = tk.Text(self.tutor_frame, wrap=tk.WORD, font=("Arial", 12), bg="#f9f9f9", padx=10, pady=10)
         self.tutor_panel.pack(fill=tk.BOTH, expand=True)
 
-        # --- Bottom: Console ---
+        # Whole-file outline, kept current by the same incremental analysis
+        self.outline_label = tk.Label(self.tutor_frame, text="OUTLINE", font=("Arial", 10, "bold"), bg="white")
+        self.outline_label.pack(pady=5)
+        self.outline_panel = tk.Text(self.tutor_frame, wrap=tk.NONE, height=12, font=("Courier New", 10),
+                                     bg="#f9f9f9", padx=10, pady=5, cursor="hand2")
+        self.outline_panel.pack(fill=tk.BOTH)
+        self.outline_panel.bind("<ButtonRelease-1>", self.jump_to_outline_entry)
+
+        # --- Diagnostics bar (live syntax check while typing) ---
+        self.diag_bar = tk.Label(root, text="", anchor="w", bg="#eeeeee", font=("Arial", 10))
+        self.diag_bar.pack(side=tk.BOTTOM, fill=tk.X)
+
+        # --- Bottom: Console, with a line for typing into the running program ---
+        self.stdin_entry = tk.Entry(root, bg="#2d2d2d", fg="#00ff00", insertbackground="#00ff00", font=("Consolas", 10))
+        self.stdin_entry.pack(side=tk.BOTTOM, fill=tk.X)
+        self.stdin_entry.bind("<Return>", self.send_input)
+
         self.console = tk.Text(root, height=10, bg="#1e1e1e", fg="#00ff00", font=("Consolas", 10))
         self.console.pack(side=tk.BOTTOM, fill=tk.X)
         self.console.insert(tk.END, "Console Output will appear here...\n")
+        self.root.after(OUTPUT_POLL_MS, self.drain_output)
 
-    def update_explanation(self, event):
-        # Get the current line content
-        idx = self.editor.index(tk.INSERT).split('.')[0]
-        line_content = self.editor.get(f"{idx}.0", f"{idx}.end")
-        
-        # Get explanation
-        explanation = self.logic.explain_line(line_content)
-        
+    def on_modified(self, event=None):
+        # Clearing the flag fires <<Modified>> again; only real edits get past this
+        if not self.editor.edit_modified():
+            return
+        self.editor.edit_modified(False)
+        if self._analysis_job is not None:
+            self.root.after_cancel(self._analysis_job)
+        self._analysis_job = self.root.after(ANALYSIS_DELAY_MS, self.run_analysis)
+
+    def run_analysis(self):
+        self._analysis_job = None
+        if self.analysis.update(self.editor.get("1.0", "end-1c")):
+            self.show_outline()
+            self.update_explanation()
+
+    def update_explanation(self, event=None):
+        # Get the current line (its explanation was computed by the last analysis)
+        idx = int(self.editor.index(tk.INSERT).split('.')[0])
+        explanation = self.analysis.explanation_at(idx)
+        if explanation is None:
+            explanation = self.logic.explain_line(self.editor.get(f"{idx}.0", f"{idx}.end"))
+
+        # Leave the panel alone unless there's something new to show
+        if (idx, explanation) == self._shown_explanation:
+            return
+        self._shown_explanation = (idx, explanation)
         self.tutor_panel.delete('1.0', tk.END)
         self.tutor_panel.insert(tk.END, f"Line {idx}:\n\n{explanation}")
-    
+
+    def show_outline(self):
+        rows = [f"{entry.line_no:>4}  {'  ' * entry.depth}{entry.summary}" for entry in self.analysis.outline]
+        if rows == self._shown_outline:
+            return
+        self._shown_outline = rows
+        self.outline_panel.delete('1.0', tk.END)
+        self.outline_panel.insert(tk.END, "\n".join(rows))
+
+    def jump_to_outline_entry(self, event):
+        row = int(self.outline_panel.index(f"@{event.x},{event.y}").split('.')[0])
+        if row <= len(self.analysis.outline):
+            line_no = self.analysis.outline[row - 1].line_no
+            self.editor.mark_set(tk.INSERT, f"{line_no}.0")
+            self.editor.see(f"{line_no}.0")
+            self.editor.focus_set()
+            self.update_explanation()
+
+    def schedule_diagnostics(self, event=None):
+        # Debounce: every keystroke pushes the check back a little
+        if self._diagnostics_job is not None:
+            self.root.after_cancel(self._diagnostics_job)
+        self._diagnostics_job = self.root.after(DIAGNOSTICS_DELAY_MS, self.start_diagnostics)
+
+    def start_diagnostics(self):
+        self._diagnostics_job = None
+        code_content = self.editor.get("1.0", tk.END)
+        threading.Thread(target=self.check_syntax, args=(code_content,), daemon=True).start()
+
+    def check_syntax(self, code_content):
+        # Starting a new check kills any older one; a superseded check returns None
+        found = self.checker.check(code_content)
+        if found is not None:
+            self.root.after(0, lambda: self.show_diagnostics(found))
+
+    def show_diagnostics(self, found):
+        self.editor.tag_remove("diag_error", "1.0", tk.END)
+        self.editor.tag_remove("diag_warning", "1.0", tk.END)
+        for d in found:
+            tag = "diag_warning" if d.kind == "warning" else "diag_error"
+            self.editor.tag_add(tag, f"{d.line}.0", f"{d.line}.end")
+
+        errors = [d for d in found if d.kind != "warning"]
+        if not found:
+            self.diag_bar.config(text="✔ No problems found", fg="#2e7d32")
+        else:
+            first = errors[0] if errors else found[0]
+            hint = first.tip or first.message
+            self.diag_bar.config(text=f"Line {first.line}: 💡 {hint}   ({len(errors)} error(s), {len(found) - len(errors)} warning(s))",
+                                 fg="#c62828" if errors else "#8d6e00")
+
+    def selected_standard(self):
+        return None if self.standard.get() == "default" else self.standard.get()
 
     def run_code(self):
+        flags = build_flags(self.opt_level.get(), self.selected_standard())
+        self.start_job(self.build_and_run, flags, f"Compiling ({' '.join(flags)})...\n")
+
+    def compare_code(self):
+        # The chosen level against -O0 (or -O0 against -O2 when -O0 is chosen)
+        level = self.opt_level.get()
+        other = "-O2" if level == "-O0" else level
+        builds = [(l, build_flags(l, self.selected_standard())) for l in ("-O0", other)]
+        self.start_job(self.compare_builds, builds, f"Comparing -O0 and {other} (the program gets no input)...\n")
+
+    def start_job(self, target, options, banner):
+        # Run again = stop whatever is still running and start over right away
+        generation = self.stop_run(quiet=True)
+        with self._run_lock:
+            self._busy_generation = generation
+
         # UI updates must happen in the main thread
         self.console.delete('1.0', tk.END)
-        self.console.insert(tk.END, "Compiling...\n")
+        self.console.insert(tk.END, banner)
         
         # Get code from editor (Tkinter is not thread-safe, so get text here)
         code_content = self.editor.get("1.0", tk.END)
         
         # Start a new thread for blocking operations (IO/Process)
-        threading.Thread(target=self.execute_process, args=(code_content,), daemon=True).start()
+        threading.Thread(target=self.execute_process, args=(target, code_content, options, generation),
+                         daemon=True).start()
 
-    def execute_process(self, code_content):
-        # Write the code to the file
+    def stop_run(self, quiet=False):
+        """Kills the current program (or abandons the build in progress). Returns the new generation."""
+        with self._run_lock:
+            busy = self._busy_generation == self._run_generation
+            self._run_generation += 1  # anything the old run still prints is dropped
+            run, self.current_run = self.current_run, None
+            generation = self._run_generation
+        if run is not None:
+            run.kill()
+        if not quiet:
+            self.console.insert(tk.END, "\n⏹ Stopped.\n" if busy else "\n(Nothing is running.)\n")
+            self.console.see(tk.END)
+        return generation
+
+    def send_input(self, event=None):
+        text = self.stdin_entry.get()
+        self.stdin_entry.delete(0, tk.END)
+        with self._run_lock:
+            run = self.current_run
+        if run is None:
+            self.console.insert(tk.END, "\n(Program is not running.)\n")
+            return
+        self.console.insert(tk.END, text + "\n")  # echo, like a terminal
+        self.console.see(tk.END)
         try:
-            with open("temp.cpp", "w") as f:
-                f.write(code_content)
-        except Exception as e:
-             self.root.after(0, lambda: self.console.insert(tk.END, f"❌ Error saving file: {str(e)}\n"))
-             return
+            run.proc.stdin.write((text + "\n").encode())
+            run.proc.stdin.flush()
+        except OSError:
+            pass  # program already closed stdin or exited
 
-        # Check if the executable exists and try to remove it (cleanup)
-        if os.path.exists("temp.exe"):
-            try:
-                os.remove("temp.exe")
-            except PermissionError:
-                self.root.after(0, lambda: self.console.insert(tk.END, "❌ Error: The program is still running. Please close it before running again!\n"))
-                return 
+    def emit(self, generation, text):
+        # Safe from any thread; drain_output() puts it on screen
+        self.output_queue.put((generation, text))
 
-        # Compile
-        comp = subprocess.run(['g++', 'temp.cpp', '-o', 'temp.exe'], capture_output=True, text=True)
-        
-        if comp.returncode != 0:
+    def drain_output(self):
+        # Everything queued since the last tick goes in as one insert
+        parts = []
+        try:
+            while True:
+                generation, text = self.output_queue.get_nowait()
+                if generation == self._run_generation:  # drop leftovers from a replaced run
+                    parts.append(text)
+        except queue.Empty:
+            pass
+        if parts:
+            self.console.insert(tk.END, "".join(parts))
+            self.console.see(tk.END)
+        self.root.after(OUTPUT_POLL_MS, self.drain_output)
+
+    def stream(self, run, pipe, generation, total, prefix=""):
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        for chunk in run.chunks(pipe):
+            with self._run_lock:
+                room = self.run_limits.output_bytes - total[0]
+                total[0] += len(chunk)
+            if room > 0:
+                self.emit(generation, prefix + decoder.decode(chunk[:room]))
+            if len(chunk) > room:
+                run.kill(limit="output")
+                break
+        self.emit(generation, decoder.decode(b"", final=True))
+        pipe.close()
+
+    def execute_process(self, target, code_content, options, generation):
+        try:
+            target(code_content, options, generation)
+        finally:
+            with self._run_lock:
+                if self._busy_generation == generation:
+                    self._busy_generation = None
+                if self._run_generation == generation:
+                    self.current_run = None
+
+    def build(self, code_content, flags, generation):
+        """Compiles (or reuses the cached binary); returns the exe path, or None after reporting why."""
+        try:
+            comp = self.build_cache.compile(code_content, flags)
+        except Exception as e:
+             self.emit(generation, f"❌ Build Error: {str(e)}\n")
+             return None
+
+        if not comp.ok:
             raw_error = comp.stderr
             friendly_msg = "Sensei: I found a small mistake!\n\n"
             
-            if "expected ';'" in raw_error:
-                friendly_msg += "💡 Tip: You forgot a semicolon (;) at the end of a line. In C++, that's like a period at the end of a sentence."
-            elif "was not declared in this scope" in raw_error:
-                friendly_msg += "💡 Tip: You're using a name that the computer doesn't recognize. Did you forget to create the variable first?"
+            tip = diagnostics.friendly_tip(raw_error)
+            if tip:
+                friendly_msg += "💡 Tip: " + tip
             else:
                 friendly_msg += "Technical Error Details:\n" + raw_error
                 
-            self.root.after(0, lambda: self.console.insert(tk.END, friendly_msg))
-        else:
-            self.root.after(0, lambda: self.console.insert(tk.END, "Compilation successful! Running program...\n"))
-            
-            # Run the compiled executable
+            self.emit(generation, friendly_msg)
+            return None
+        return comp.exe
+
+    def track_run(self, run, generation):
+        # Makes the run stoppable, or kills it right away if it's already been replaced
+        with self._run_lock:
+            superseded = generation != self._run_generation
+            if not superseded:
+                self.current_run = run
+        if superseded:
+            run.kill()
+
+    def compare_builds(self, code_content, builds, generation):
+        measured = []
+        for label, flags in builds:
+            exe = self.build(code_content, flags, generation)
+            if exe is None or generation != self._run_generation:
+                return
+            self.emit(generation, f"Running at {label}...\n")
             try:
-                run = subprocess.run(['temp.exe'], capture_output=True, text=True, timeout=5) # Added timeout for safety
-                output = run.stdout
-                errors = run.stderr
-                
-                self.root.after(0, lambda: self.console.insert(tk.END, output))
-                if errors:
-                    self.root.after(0, lambda: self.console.insert(tk.END, "\nRuntime Errors:\n" + errors))
-            except subprocess.TimeoutExpired:
-                 self.root.after(0, lambda: self.console.insert(tk.END, "\n❌ Error: Program took too long to run (Infinite loop?)."))
+                with sandbox.scratch_dir() as workdir:
+                    out, err, usage = sandbox.run(exe, self.run_limits, workdir,
+                                                  on_start=lambda run: self.track_run(run, generation))
             except Exception as e:
-                 self.root.after(0, lambda: self.console.insert(tk.END, f"\n❌ Execution Error: {str(e)}"))
+                self.emit(generation, f"\n❌ Execution Error: {str(e)}")
+                return
+            if generation != self._run_generation:
+                return  # stopped
+            measured.append(coach.Measured(label, usage, out.decode("utf-8", errors="replace")))
+            if len(measured) == 1:
+                self.emit(generation, measured[0].output + err.decode("utf-8", errors="replace"))
+
+        self.emit(generation, "\n" + coach.compare_report(measured, self.run_limits) + "\n")
+        tips = coach.format_tips(self.coach.tips(code_content))
+        self.emit(generation, "\n" + (tips or "Performance coach: nothing to flag in this code. 👍") + "\n")
+
+    def build_and_run(self, code_content, flags, generation):
+        # Compile (or reuse the cached binary if this exact code was built before)
+        exe = self.build(code_content, flags, generation)
+        if exe is None:
+            return
+
+        self.emit(generation, "Compilation successful! Running program...\n")
+        if generation != self._run_generation:
+            return  # stopped, or Run was pressed again, while we compiled
+
+        # Run the compiled executable in its own scratch folder, under resource limits,
+        # and stream its output as it is printed
+        try:
+            with sandbox.scratch_dir() as workdir:
+                run = sandbox.Run(exe, self.run_limits, workdir)
+                self.track_run(run, generation)
+
+                total = [0]
+                readers = [threading.Thread(target=self.stream, args=(run, run.proc.stdout, generation, total), daemon=True),
+                           threading.Thread(target=self.stream, args=(run, run.proc.stderr, generation, total, "Error: "), daemon=True)]
+                for t in readers:
+                    t.start()
+                usage = run.wait()
+                for t in readers:
+                    t.join()
+
+            if usage.limit == "wall":
+                self.emit(generation, "\n❌ Error: Program took too long to run (Infinite loop?).")
+            elif usage.limit:
+                self.emit(generation, f"\n❌ Error: {usage.limit_message(self.run_limits)}.")
+            self.emit(generation, f"\n[{usage.describe()}]\n")
+        except Exception as e:
+             self.emit(generation, f"\n❌ Execution Error: {str(e)}")
 
 if __name__ == "__main__":
     root = tk.Tk()
@@ -0,0 +1,240 @@
+"""
+In-process metrics in the Prometheus text format, plus structured request logs.
+
+Recording is a dict update under a lock (plus a bisect for histograms), so it
+stays on in production. GET /metrics renders everything registered here.
+
+Each server worker process keeps its own numbers, and a scrape reaches
+whichever worker accepted it, so every series carries a worker="<pid>"
+label: sum over it (e.g. sum without (worker) (...)) for server-wide totals.
+"""
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+REGISTRY = []
+
+# Seconds. Compiles and runs take 0.1 s to a minute; explains are sub-millisecond.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    pairs.append(f'worker="{os.getpid()}"')  # looked up per render: workers are forked
+    return "{" + ",".join(pairs) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict):
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield from self._samples(key, value)
+
+    def _samples(self, key, value):
+        yield f"{self.name}{_format_labels(self.labels, key)} {value:g}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self, key, state):
+        counts, total, count = state
+        running = 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            running += n
+            le = 'le="+Inf"' if bound == float("inf") else f'le="{bound:g}"'
+            yield f"{self.name}_bucket{_format_labels(self.labels, key, [le])} {running}"
+        yield f"{self.name}_sum{_format_labels(self.labels, key)} {total:g}"
+        yield f"{self.name}_count{_format_labels(self.labels, key)} {count}"
+
+
+def render() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+# --- What the server records ---
+
+HTTP_SECONDS = Histogram("sensei_http_request_duration_seconds", "HTTP request latency.",
+                         ("route", "method", "status"))
+WEBSOCKET_SECONDS = Histogram("sensei_websocket_duration_seconds", "How long websocket connections stay open.",
+                              ("route",), buckets=DEFAULT_BUCKETS + (300, 900, 3600))
+ACTIVE_SOCKETS = Gauge("sensei_active_websockets", "Websocket connections currently open.", ("route",))
+EXPLAIN_SECONDS = Histogram("sensei_explain_duration_seconds", "Time spent producing explanations.",
+                            ("endpoint",), buckets=FAST_BUCKETS)
+QUEUE_WAIT_SECONDS = Histogram("sensei_queue_wait_seconds", "Time spent waiting for a compile slot.")
+COMPILE_SECONDS = Histogram("sensei_compile_duration_seconds", "Compile time, including binary cache hits.",
+                            ("result",))
+RUN_SECONDS = Histogram("sensei_run_duration_seconds", "Wall time of sandboxed program runs.", ("endpoint",))
+RUN_CPU_SECONDS = Histogram("sensei_run_cpu_seconds", "CPU time of sandboxed program runs.", ("endpoint",))
+BYTES_STREAMED = Counter("sensei_output_bytes_total", "Program output bytes streamed to clients.", ("endpoint",))
+FAILURES = Counter("sensei_failures_total", "Failed requests by stage and reason.", ("stage", "reason"))
+
+
+def record_run(endpoint: str, usage, output_bytes: int = 0, timings=None):
+    """Run-stage metrics for one finished program."""
+    RUN_SECONDS.observe(usage.wall_seconds, endpoint=endpoint)
+    if usage.cpu_seconds is not None:
+        RUN_CPU_SECONDS.observe(usage.cpu_seconds, endpoint=endpoint)
+    if output_bytes:
+        BYTES_STREAMED.inc(output_bytes, endpoint=endpoint)
+    if usage.limit:
+        FAILURES.inc(stage="run", reason=f"{usage.limit}_limit")
+    elif usage.returncode != 0:
+        FAILURES.inc(stage="run", reason="nonzero_exit")
+    if timings is not None:
+        timings.update(run_ms=round(usage.wall_seconds * 1000, 2), cpu_s=usage.cpu_seconds,
+                       peak_rss_kb=usage.peak_rss_kb, exit_code=usage.returncode, limit=usage.limit,
+                       output_bytes=output_bytes)
+
+
+# --- Structured request logs ---
+
+request_log = logging.getLogger("sensei.requests")
+if not request_log.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    request_log.addHandler(_handler)
+    request_log.propagate = False
+request_log.setLevel(logging.INFO if os.environ.get("SENSEI_REQUEST_LOG", "1") == "1" else logging.WARNING)
+
+
+def log_event(request_id: str, event: str, **fields):
+    """One JSON line per finished request or stage, keyed by request id."""
+    if request_log.isEnabledFor(logging.INFO):
+        request_log.info(json.dumps({"ts": round(time.time(), 3), "request_id": request_id,
+                                     "event": event, **fields}))
+
+
+def request_id(connection) -> str:
+    """The id RequestMetrics gave this request/websocket ('-' outside the middleware)."""
+    return getattr(connection.state, "request_id", "-")
+
+
+class RequestMetrics:
+    """
+    ASGI middleware: gives every request and websocket an id (honouring an
+    incoming X-Request-ID), times it, counts open sockets and logs one line
+    when it finishes.
+    """
+
+    SKIP_LOG = {"/metrics"}  # scrapes would drown out everything else
+
+    def __init__(self, app):
+        self.app = app
+        self._routes = None
+
+    def _route(self, scope) -> str:
+        # Label by known route only, so random paths can't blow up the label set
+        if self._routes is None and "app" in scope:
+            self._routes = {getattr(r, "path", None) for r in scope["app"].routes}
+        path = scope.get("path", "")
+        return path if self._routes and path in self._routes else "other"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        incoming = dict(scope.get("headers") or []).get(b"x-request-id", b"").decode("latin-1")
+        rid = incoming[:64] or uuid.uuid4().hex[:16]
+        scope.setdefault("state", {})["request_id"] = rid
+        route = self._route(scope)
+        start = time.perf_counter()
+
+        if scope["type"] == "websocket":
+            ACTIVE_SOCKETS.inc(route=route)
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                took = time.perf_counter() - start
+                ACTIVE_SOCKETS.dec(route=route)
+                WEBSOCKET_SECONDS.observe(took, route=route)
+                log_event(rid, "websocket", path=scope.get("path"), duration_ms=round(took * 1000, 2))
+            return
+
+        status = [500]
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", rid.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            took = time.perf_counter() - start
+            HTTP_SECONDS.observe(took, route=route, method=scope.get("method", ""), status=status[0])
+            if scope.get("path") not in self.SKIP_LOG:
+                log_event(rid, "http", method=scope.get("method"), path=scope.get("path"),
+                          status=status[0], duration_ms=round(took * 1000, 2))
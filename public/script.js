@@ -1,3 +1,8 @@
+// The API lives wherever the page came from (server.py serves both); opened
+// straight from disk, fall back to a local dev server
+const API_BASE = location.protocol.startsWith('http') ? location.origin : 'http://localhost:8000';
+const WS_BASE = API_BASE.replace(/^http/, 'ws');
+
 // Global State
 let isBeginnerMode = true;
 let explanationMode = 'idle'; // 'idle', 'line', 'full'
@@ -70,7 +75,7 @@ function setupEventListeners() {
     // Close Console
     document.getElementById('closeConsole').addEventListener('click', () => {
         document.getElementById('consolePanel').style.display = 'none';
-        if (socket) socket.close();
+        cancelRun();
     });
 }
 
@@ -102,7 +107,43 @@ function toggleTheme() {
 // Code Editor Functions
 // ... Theme ... (unchanged)
 
-let socket = null;
+// One persistent session socket (/ws/session) carries every run; replies are
+// routed back to their request by id, so a new run doesn't need a new connection.
+let session = null;
+let sessionReady = null;
+let nextRequestId = 1;
+const sessionHandlers = {};
+let currentRunId = null;
+
+function getSession() {
+    if (sessionReady) return sessionReady;
+    sessionReady = new Promise((resolve, reject) => {
+        const ws = new WebSocket(`${WS_BASE}/ws/session`);
+        ws.onopen = () => { session = ws; resolve(ws); };
+        ws.onmessage = (event) => {
+            const msg = JSON.parse(event.data);
+            const handler = sessionHandlers[msg.id];
+            if (handler) handler(msg);
+        };
+        ws.onclose = () => {
+            session = null;
+            sessionReady = null;
+            // Anything still in flight has lost its connection
+            for (const id of Object.keys(sessionHandlers)) {
+                sessionHandlers[id]({ id: id, type: 'disconnected' });
+            }
+        };
+        ws.onerror = () => reject(new Error('Connection Error'));
+    });
+    return sessionReady;
+}
+
+function cancelRun() {
+    if (currentRunId !== null && session) {
+        session.send(JSON.stringify({ id: currentRunId, type: 'cancel' }));
+    }
+    currentRunId = null;
+}
 
 async function handleRunCode() {
     const code = document.getElementById('codeTextarea').value;
@@ -116,35 +157,44 @@ async function handleRunCode() {
     consoleInput.value = '';
     consoleInput.focus();
 
-    // Close existing socket
-    if (socket) {
-        socket.close();
-    }
-
-    showToast('Connecting...', 'Establishing connection to server...');
+    // Stop the previous run, if any
+    cancelRun();
 
-    try {
-        socket = new WebSocket('ws://localhost:8000/ws/run');
-
-        socket.onopen = function () {
-            socket.send(JSON.stringify({ code: code }));
-            showToast('Running', 'Connected! Program starting...');
-        };
-
-        socket.onmessage = function (event) {
-            consoleOutput.textContent += event.data;
-            consoleOutput.scrollTop = consoleOutput.scrollHeight;
-        };
-
-        socket.onclose = function () {
-            consoleOutput.textContent += '\n\n[Disconnected]';
-        };
+    const runId = nextRequestId++;
+    const print = (text) => {
+        if (currentRunId !== runId) return; // output from a run we've moved on from
+        consoleOutput.textContent += text;
+        consoleOutput.scrollTop = consoleOutput.scrollHeight;
+    };
 
-        socket.onerror = function () {
-            consoleOutput.textContent += '\n[Connection Error]';
-        };
+    sessionHandlers[runId] = function (msg) {
+        if (msg.type === 'queued') {
+            print(`Queued: position ${msg.position} in line...\n`);
+        } else if (msg.type === 'compile') {
+            print(msg.ok ? 'Running...\n' : 'Compilation Error:\n' + msg.stderr);
+        } else if (msg.type === 'output') {
+            print(msg.data);
+        } else if (msg.type === 'exit') {
+            if (msg.stopped) print(`\n[Stopped: ${msg.stopped}]`);
+            print(`\n[Program Finished] ${msg.summary}`);
+        } else if (msg.type === 'error') {
+            print('\n' + msg.message);
+        } else if (msg.type === 'disconnected') {
+            print('\n\n[Disconnected]');
+        }
+        if (msg.type !== 'queued' && msg.type !== 'output' && !(msg.type === 'compile' && msg.ok)) {
+            delete sessionHandlers[runId];
+            if (currentRunId === runId) currentRunId = null;
+        }
+    };
 
+    try {
+        const ws = await getSession();
+        currentRunId = runId;
+        ws.send(JSON.stringify({ id: runId, type: 'run', code: code }));
+        showToast('Running', 'Program starting...');
     } catch (e) {
+        delete sessionHandlers[runId];
         consoleOutput.textContent = 'Error connecting: ' + e.message;
     }
 }
@@ -153,8 +203,8 @@ function sendConsoleInput() {
     const inputField = document.getElementById('consoleInput');
     const text = inputField.value;
 
-    if (socket && socket.readyState === WebSocket.OPEN) {
-        socket.send(text);
+    if (session && currentRunId !== null) {
+        session.send(JSON.stringify({ id: currentRunId, type: 'stdin', data: text }));
         // Echo input to console for better UX
         const consoleOutput = document.getElementById('consoleOutput');
         consoleOutput.textContent += text + '\n';
@@ -172,44 +222,49 @@ async function handleLineExplain() {
 
     const container = document.getElementById('lineExplanations');
     const code = document.getElementById('codeTextarea').value;
-    const lines = code.split('\n');
 
     container.innerHTML = '<div style="padding: 20px; text-align: center;">Analyzing code with AI... <span class="loading-spinner">Analyzing...</span></div>';
     showToast('Analyzing', 'Getting line-by-line explanations...');
 
     let explanationsHtml = '';
 
-    // Process unique non-empty lines to avoid too many requests
-    // For a smoother demo, we'll explain non-empty lines
-
+    // One streaming request for the whole file; the server explains each distinct
+    // line once and sends results back as NDJSON, so we can render as they arrive.
     try {
-        for (let i = 0; i < lines.length; i++) {
-            const lineContent = lines[i].trim();
-            if (!lineContent || lineContent.startsWith('//')) continue;
+        const response = await fetch(`${API_BASE}/explain/stream`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ code: code })
+        });
 
-            // Call backend for this line
-            const response = await fetch('http://localhost:8000/explain', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ line: lineContent })
-            });
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
 
-            const data = await response.json();
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
 
-            // Only show if it returned a meaningful explanation (not default fallback)
-            // But logic.py fallback is "I'm watching...", which we might display or filter.
-            // Let's display everything for now.
+            const rows = buffer.split('\n');
+            buffer = rows.pop(); // keep any partial line for the next chunk
+            for (const row of rows) {
+                if (!row) continue;
+                const data = JSON.parse(row);
+                const lineContent = data.line;
 
-            explanationsHtml += `
+                explanationsHtml += `
             <div class="line-explanation">
                 <div class="line-explanation-header">
-                    <span class="line-badge">Line ${i + 1}</span>
+                    <span class="line-badge">Line ${data.line_no}</span>
                     <code class="line-code">${lineContent.substring(0, 40)}${lineContent.length > 40 ? '...' : ''}</code>
                 </div>
                 <div class="line-explanation-content">
                     ${data.explanation}
                 </div>
             </div>`;
+            }
+            if (explanationsHtml !== '') container.innerHTML = explanationsHtml;
         }
 
         if (explanationsHtml === '') {
@@ -0,0 +1,494 @@
+import asyncio
+import os
+import select
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import NamedTuple, Optional
+
+from compiler import CompileCache, per_user, private_dir
+
+# How long pipes are still read after the program has exited. Its output is
+# normally all there by then; anything still holding a pipe open is a process
+# that escaped cleanup, and nobody should wait on it.
+DRAIN_GRACE_SECONDS = 1.0
+
+
+class Limits(NamedTuple):
+    cpu_seconds: int = 5
+    wall_seconds: float = 120          # generous: interactive programs wait on a human
+    memory_bytes: int = 256 * 1024 * 1024
+    # RLIMIT_NPROC counts every process and thread of the user the program runs
+    # as, not just the program's own. As the server's user that includes the
+    # server's threads (so fork/std::thread can fail with EAGAIN), and root
+    # ignores it altogether. Set run_as_uid to a dedicated account to make it
+    # mean something; it is then shared by all programs running at once.
+    max_processes: int = 32
+    output_bytes: int = 1024 * 1024    # pipes are capped by the caller, files by RLIMIT_FSIZE
+    run_as_uid: Optional[int] = None   # switch to this user/group before exec (server must be root)
+    run_as_gid: Optional[int] = None   # defaults to run_as_uid
+
+    @classmethod
+    def from_env(cls, **overrides) -> "Limits":
+        defaults = cls()
+        values = dict(
+            cpu_seconds=int(os.environ.get("SENSEI_CPU_SECONDS", defaults.cpu_seconds)),
+            wall_seconds=float(os.environ.get("SENSEI_WALL_SECONDS", defaults.wall_seconds)),
+            memory_bytes=int(os.environ.get("SENSEI_MEMORY_BYTES", defaults.memory_bytes)),
+            max_processes=int(os.environ.get("SENSEI_MAX_PROCESSES", defaults.max_processes)),
+            output_bytes=int(os.environ.get("SENSEI_OUTPUT_BYTES", defaults.output_bytes)),
+        )
+        if os.environ.get("SENSEI_RUN_UID"):
+            values["run_as_uid"] = int(os.environ["SENSEI_RUN_UID"])
+            values["run_as_gid"] = int(os.environ.get("SENSEI_RUN_GID") or values["run_as_uid"])
+        values.update(overrides)
+        return cls(**values)
+
+
+class Usage(NamedTuple):
+    returncode: Optional[int]
+    cpu_seconds: Optional[float]   # user + sys, None where wait4 isn't available
+    wall_seconds: float
+    peak_rss_kb: Optional[int]
+    limit: Optional[str] = None    # which limit stopped the program, if any
+
+    def describe(self) -> str:
+        """One-line summary for the console."""
+        parts = [f"exit code {self.returncode}"]
+        if self.cpu_seconds is not None:
+            parts.append(f"CPU {self.cpu_seconds:.3f} s")
+        parts.append(f"wall {self.wall_seconds:.3f} s")
+        if self.peak_rss_kb is not None:
+            parts.append(f"peak memory {self.peak_rss_kb / 1024:.1f} MB")
+        return " | ".join(parts)
+
+    def limit_message(self, limits: Limits) -> Optional[str]:
+        if self.limit == "cpu":
+            return f"CPU time limit of {limits.cpu_seconds} s exceeded (infinite loop?)"
+        if self.limit == "wall":
+            return f"Time limit of {limits.wall_seconds:g} s exceeded"
+        if self.limit == "output":
+            return f"Output limit of {limits.output_bytes // 1024} KB exceeded"
+        return None
+
+
+@contextmanager
+def scratch_dir(root: str = None):
+    """A private working directory for one run, removed afterwards."""
+    path = tempfile.mkdtemp(prefix="sensei-run-", dir=root)
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def default_scratch_base() -> str:
+    """Where worker scratch roots live: tmpfs (/dev/shm) when there is one, else the temp dir."""
+    shm = "/dev/shm"
+    parent = shm if os.path.isdir(shm) and os.access(shm, os.W_OK | os.X_OK) else tempfile.gettempdir()
+    return os.path.join(parent, per_user("sensei-scratch"))
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # someone else's process
+    return True
+
+
+def worker_scratch_root(base: str = None) -> str:
+    """
+    Creates this process's own scratch root, <base>/worker-<pid>, for scratch_dir().
+    base defaults to SENSEI_SCRATCH_ROOT, else default_scratch_base(). Roots left
+    behind by workers that are no longer running are removed on the way.
+    """
+    base = base or os.environ.get("SENSEI_SCRATCH_ROOT") or default_scratch_base()
+    private_dir(base)
+    for name in os.listdir(base):
+        pid = name[len("worker-"):]
+        if name.startswith("worker-") and pid.isdigit() and not _pid_alive(int(pid)):
+            shutil.rmtree(os.path.join(base, name), ignore_errors=True)
+    root = os.path.join(base, f"worker-{os.getpid()}")
+    shutil.rmtree(root, ignore_errors=True)  # from an earlier process that had our pid
+    private_dir(root)
+    return root
+
+
+# Tiny launcher that sits between us and the student's program. It forks,
+# puts the child in its own process group under rlimits, execs it, and
+# reports the child's pid and then its wait4() status/rusage on a pipe.
+# Measuring from here rather than from Python matters: ru_maxrss survives
+# exec, so a child forked straight from the server would report the server's
+# own RSS as its peak.
+# On Linux it is also a child subreaper: anything the program leaves behind,
+# even after setsid(), is reparented to the launcher, which kills and reaps
+# all of it before reporting, so nothing outlives the run holding our pipes.
+LAUNCHER_SOURCE = r"""
+#include <dirent.h>
+#include <errno.h>
+#include <signal.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <unistd.h>
+#include <grp.h>
+#include <sys/resource.h>
+#include <sys/wait.h>
+#ifdef __linux__
+#include <sys/prctl.h>
+
+/* SIGKILLs every process whose parent is us */
+static void kill_children(void) {
+    DIR *proc = opendir("/proc");
+    if (!proc) return;
+    struct dirent *e;
+    char path[64], buf[512];
+    while ((e = readdir(proc)) != NULL) {
+        if (e->d_name[0] < '0' || e->d_name[0] > '9') continue;
+        snprintf(path, sizeof path, "/proc/%s/stat", e->d_name);
+        FILE *f = fopen(path, "r");
+        if (!f) continue;
+        size_t n = fread(buf, 1, sizeof buf - 1, f);
+        fclose(f);
+        buf[n] = 0;
+        char *end = strrchr(buf, ')');  /* the command name may contain spaces and parens */
+        int ppid;
+        if (end && sscanf(end + 1, " %*c %d", &ppid) == 1 && ppid == getpid())
+            kill(atoi(e->d_name), SIGKILL);
+    }
+    closedir(proc);
+}
+
+/* Orphans are reparented to us (a subreaper), so kill and reap until none are left.
+   Every living descendant has an ancestor among our children, so each round
+   either reaps something or ends with ECHILD. */
+static void reap_descendants(pid_t group) {
+    kill(-group, SIGKILL);
+    for (;;) {
+        kill_children();
+        if (wait(NULL) < 0 && errno == ECHILD) break;
+    }
+}
+#endif
+
+static void limit(int which, unsigned long long soft, unsigned long long hard) {
+    struct rlimit r;
+    r.rlim_cur = soft;
+    r.rlim_max = hard;
+    setrlimit(which, &r);
+}
+
+/* usage: launcher REPORT_FD CPU_S MEM_BYTES NPROC FSIZE_BYTES UID GID PROGRAM (UID -1: stay as is) */
+int main(int argc, char **argv) {
+    if (argc < 9) return 127;
+    int report = atoi(argv[1]);
+#ifdef __linux__
+    prctl(PR_SET_CHILD_SUBREAPER, 1);
+#endif
+    pid_t pid = fork();
+    if (pid < 0) return 127;
+    if (pid == 0) {
+        close(report);
+        setpgid(0, 0);
+        unsigned long long cpu = strtoull(argv[2], 0, 10);
+        limit(RLIMIT_CPU, cpu, cpu + 1);  /* SIGXCPU, then SIGKILL a second later */
+        limit(RLIMIT_AS, strtoull(argv[3], 0, 10), strtoull(argv[3], 0, 10));
+        limit(RLIMIT_NPROC, strtoull(argv[4], 0, 10), strtoull(argv[4], 0, 10));
+        limit(RLIMIT_FSIZE, strtoull(argv[5], 0, 10), strtoull(argv[5], 0, 10));
+        limit(RLIMIT_CORE, 0, 0);
+        long uid = atol(argv[6]), gid = atol(argv[7]);
+        if (uid >= 0 && (setgroups(0, NULL) < 0 || setgid((gid_t)gid) < 0 || setuid((uid_t)uid) < 0))
+            _exit(127);  /* never run student code as the server's user by accident */
+        execv(argv[8], argv + 8);
+        _exit(127);
+    }
+    setpgid(pid, pid);
+    dprintf(report, "%d\n", (int)pid);
+
+    int status;
+    struct rusage ru;
+    while (wait4(pid, &status, 0, &ru) < 0) {
+        if (errno != EINTR) return 127;
+    }
+#ifdef __linux__
+    reap_descendants(pid);
+#endif
+    dprintf(report, "%d %ld.%06ld %ld.%06ld %ld\n", status,
+            (long)ru.ru_utime.tv_sec, (long)ru.ru_utime.tv_usec,
+            (long)ru.ru_stime.tv_sec, (long)ru.ru_stime.tv_usec, ru.ru_maxrss);
+    return 0;
+}
+"""
+
+_launcher_cache = None
+_launcher_lock = threading.Lock()
+
+
+def launcher_path() -> Optional[str]:
+    """Path to the built launcher, or None where it can't be used (e.g. Windows)."""
+    global _launcher_cache
+    if os.name != "posix":
+        return None
+    with _launcher_lock:
+        if _launcher_cache is None:
+            _launcher_cache = CompileCache()
+    # Goes through the cache every time so the binary counts as recently used
+    result = _launcher_cache.compile(LAUNCHER_SOURCE, ("-O2",))
+    return result.exe if result.ok else None
+
+
+# Where the launcher kills and reaps everything the program started itself
+_LAUNCHER_REAPS = sys.platform.startswith("linux")
+
+# What RLIMIT_CPU kills with: SIGXCPU at the soft limit, SIGKILL at the hard one.
+# Neither exists on Windows, where there's no launcher and so no CPU limit.
+_CPU_LIMIT_SIGNALS = {-sig for sig in (getattr(signal, "SIGKILL", None), getattr(signal, "SIGXCPU", None))
+                      if sig is not None}
+
+
+class Run:
+    """
+    One sandboxed process. kill() is safe from any thread; wait() blocks until
+    the program exits and returns its Usage. The wall-time limit counts from
+    creation, so it also covers time the caller spends feeding stdin.
+    """
+
+    def __init__(self, exe: str, limits: Limits, cwd: str):
+        self.limits = limits
+        self.limit = None  # set when we stop the program ourselves
+        self.started = time.monotonic()
+        self._pid = None
+        self._pid_lock = threading.Lock()
+        self._kill_requested = False
+        self.exited = threading.Event()  # set once wait() has the program's Usage
+        self._exited_at = None
+
+        launcher = launcher_path()
+        pipes = dict(stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd)
+        if launcher:
+            uid = -1 if limits.run_as_uid is None else limits.run_as_uid
+            gid = uid if limits.run_as_gid is None else limits.run_as_gid
+            if uid >= 0:
+                os.chown(cwd, uid, gid)  # the program's working directory is all it may write
+            read_fd, write_fd = os.pipe()
+            try:
+                self.proc = subprocess.Popen(
+                    [launcher, str(write_fd), str(limits.cpu_seconds), str(limits.memory_bytes),
+                     str(limits.max_processes), str(limits.output_bytes),
+                     str(uid), str(gid), exe],
+                    pass_fds=(write_fd,), **pipes)
+            except BaseException:
+                os.close(read_fd)
+                raise
+            finally:
+                os.close(write_fd)
+            self._report = os.fdopen(read_fd)
+        else:
+            # No launcher: only the wall-time and output limits apply
+            self.proc = subprocess.Popen([exe], **pipes)
+            self._report = None
+            self._set_pid(self.proc.pid)
+
+        self._timer = threading.Timer(limits.wall_seconds, self.kill, kwargs={"limit": "wall"})
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _set_pid(self, pid):
+        with self._pid_lock:
+            self._pid = pid
+            kill_now = self._kill_requested
+        if kill_now:
+            self._signal()
+
+    def _signal(self):
+        try:
+            if self._report is not None:
+                os.killpg(self._pid, signal.SIGKILL)  # the program and anything it spawned
+            else:
+                self.proc.kill()
+        except OSError:
+            pass
+
+    def kill(self, limit: str = None):
+        if limit and self.limit is None:
+            self.limit = limit
+        with self._pid_lock:
+            self._kill_requested = True
+            known = self._pid is not None
+        if known:
+            self._signal()
+
+    def wait(self) -> Usage:
+        report = ""
+        try:
+            if self._report is not None:
+                first = self._report.readline()
+                if first.strip():
+                    self._set_pid(int(first))
+                report = self._report.readline().split()
+                self._report.close()
+            self.proc.wait()
+        finally:
+            self._timer.cancel()
+        self._exited_at = time.monotonic()
+        self.exited.set()
+        wall = self._exited_at - self.started
+
+        if report:
+            status, utime, stime, maxrss = report
+            returncode = os.waitstatus_to_exitcode(int(status))
+            cpu = float(utime) + float(stime)
+            peak_rss = int(maxrss)  # kilobytes on Linux
+            if not _LAUNCHER_REAPS:
+                # Stray children (background processes, fork bombs) die with the run
+                self._signal()
+        else:
+            returncode = self.proc.returncode
+            cpu = peak_rss = None
+
+        limit = self.limit
+        if limit is None and cpu is not None and returncode in _CPU_LIMIT_SIGNALS \
+                and cpu >= self.limits.cpu_seconds * 0.95:
+            limit = "cpu"
+        return Usage(returncode, cpu, wall, peak_rss, limit)
+
+    def chunks(self, pipe, size: int = 65536):
+        """
+        Yields what the program writes to stdout or stderr, as it comes, until EOF
+        or DRAIN_GRACE_SECONDS after the program exited. Closes the pipe.
+        """
+        fd = pipe.fileno()
+        try:
+            while True:
+                if os.name == "posix":
+                    ready, _, _ = select.select([fd], [], [], 0.25)
+                    if not ready:
+                        if self.exited.is_set() and time.monotonic() - self._exited_at > DRAIN_GRACE_SECONDS:
+                            return
+                        continue
+                chunk = os.read(fd, size)
+                if not chunk:
+                    return
+                yield chunk
+        finally:
+            pipe.close()
+
+
+def run(exe: str, limits: Limits, cwd: str, stdin_data: bytes = b"", on_start=None):
+    """
+    Runs to completion and returns (stdout, stderr, Usage). For callers without an event loop.
+    on_start(run) gets the Run as soon as it exists, e.g. to kill() it from elsewhere.
+    """
+    proc = Run(exe, limits, cwd)
+    if on_start:
+        on_start(proc)
+    out, err = [], []
+    total = [0]
+    total_lock = threading.Lock()
+
+    def drain(pipe, into):
+        for chunk in proc.chunks(pipe):
+            with total_lock:
+                room = limits.output_bytes - total[0]
+                total[0] += len(chunk)
+            if room > 0:
+                into.append(chunk[:room])
+            if len(chunk) > room:
+                proc.kill(limit="output")
+
+    def feed():
+        # A thread, so a program that never reads its input can't block us past the wall limit
+        try:
+            proc.proc.stdin.write(stdin_data)
+            proc.proc.stdin.close()
+        except OSError:
+            pass  # exited (or was killed) without reading it all
+
+    threads = [threading.Thread(target=drain, args=(proc.proc.stdout, out), daemon=True),
+               threading.Thread(target=drain, args=(proc.proc.stderr, err), daemon=True),
+               threading.Thread(target=feed, daemon=True)]
+    for t in threads:
+        t.start()
+
+    usage = proc.wait()
+    for t in threads[:2]:
+        t.join()
+    # Only blocks if something that escaped cleanup holds stdin open without reading
+    threads[2].join(DRAIN_GRACE_SECONDS)
+    return b"".join(out), b"".join(err), usage
+
+
+class AsyncRun:
+    """
+    A sandboxed process driven from asyncio: stdin/stdout/stderr are asyncio
+    streams, and wait() resolves to the run's Usage as soon as it exits.
+    """
+
+    def __init__(self, run: Run, stdin, stdout, stderr, usage_future):
+        self.run = run
+        self.stdin = stdin
+        self.stdout = stdout
+        self.stderr = stderr
+        self._usage = usage_future
+
+    @property
+    def returncode(self):
+        return self._usage.result().returncode if self._usage.done() else None
+
+    async def wait(self) -> Usage:
+        return await asyncio.shield(self._usage)
+
+    def kill(self, limit: str = None):
+        self.run.kill(limit)
+
+
+async def start(exe: str, limits: Limits, cwd: str) -> AsyncRun:
+    loop = asyncio.get_running_loop()
+    # Building the launcher the first time calls g++, so keep it off the loop
+    proc = await loop.run_in_executor(None, Run, exe, limits, cwd)
+
+    read_transports = []
+
+    async def reader_for(pipe):
+        reader = asyncio.StreamReader(limit=2 ** 20)
+        transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+        read_transports.append(transport)
+        return reader
+
+    stdout = await reader_for(proc.proc.stdout)
+    stderr = await reader_for(proc.proc.stderr)
+    transport, protocol = await loop.connect_write_pipe(
+        lambda: asyncio.streams.FlowControlMixin(), proc.proc.stdin)
+    stdin = asyncio.StreamWriter(transport, protocol, None, loop)
+
+    def close_pipes():
+        # Readers see EOF and writers stop, even if an escaped process still holds the pipes
+        for t in read_transports:
+            if not t.is_closing():
+                t.close()
+        if not stdin.transport.is_closing():
+            stdin.transport.abort()  # drops unwritten input rather than waiting to flush it
+
+    # wait() blocks, so each live run gets its own thread rather than a slot in
+    # a shared pool that idle interactive programs could exhaust
+    usage = loop.create_future()
+
+    def waiter():
+        try:
+            result = proc.wait()
+        except Exception as e:
+            loop.call_soon_threadsafe(usage.set_exception, e)
+        else:
+            loop.call_soon_threadsafe(usage.set_result, result)
+        loop.call_soon_threadsafe(loop.call_later, DRAIN_GRACE_SECONDS, close_pipes)
+
+    threading.Thread(target=waiter, daemon=True).start()
+    return AsyncRun(proc, stdin, stdout, stderr, usage)
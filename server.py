@@ -1,15 +1,79 @@
-from fastapi import FastAPI, HTTPException, WebSocket
+from fastapi import FastAPI, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-import subprocess
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from starlette.websockets import WebSocketState
+from typing import List, Optional
+import hashlib
+import json
 import os
-import uuid
+import shutil
 import asyncio
 import threading
-from logic import SenseiLogic
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from logic import SenseiLogic, batch_lines
+from analysis import FileAnalyzer
+from compiler import CompileCache, OPT_LEVELS, build_flags
+from admission import AdmissionQueue, QueueFull
+from streaming import OutputPump
+from session import Session
+from static_assets import StaticFrontend, etag_matches
+import sandbox
+import diagnostics
+import judge
+import coach
+import metrics
 
-app = FastAPI()
-sensei = SenseiLogic() 
+# Each worker process keeps its own explanation cache: an uncached explain is
+# ~12 us, cheaper than any lookup in a store shared between processes would be.
+# Compiled binaries are the expensive part, and the build cache directory is
+# shared (and flock-safe) across workers.
+sensei = SenseiLogic(cache_size=int(os.environ.get("SENSEI_EXPLAIN_CACHE_SIZE", "4096")))
+build_cache = CompileCache()
+file_analyzer = FileAnalyzer(sensei)
+performance_coach = coach.PerformanceCoach(file_analyzer)
+
+# Server processes (`python server.py`); with gunicorn/uvicorn --workers, set it to the same count.
+# Each has its own /metrics, labelled worker="<pid>" (see metrics.py).
+WEB_WORKERS = int(os.environ.get("SENSEI_WORKERS", "1"))
+
+# This worker's scratch root on tmpfs (see sandbox.worker_scratch_root), set up at startup
+scratch_root = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global scratch_root
+    scratch_root = sandbox.worker_scratch_root()
+    build_cache.remove_stale_builds()
+    # Build the precompiled headers up front so the first students don't pay for them
+    if os.environ.get("SENSEI_PCH_WARM", "1") == "1":
+        threading.Thread(target=build_cache.warm_pch, daemon=True).start()
+    try:
+        yield
+    finally:
+        shutil.rmtree(scratch_root, ignore_errors=True)
+
+app = FastAPI(lifespan=lifespan)
+
+# Compiles run on a dedicated pool so g++ never blocks the event loop.
+# One slot per core by default (split between the workers); extra requests wait in a FIFO line.
+RUN_WORKERS = int(os.environ.get("SENSEI_RUN_WORKERS", max(1, (os.cpu_count() or 1) // WEB_WORKERS)))
+RUN_QUEUE_DEPTH = int(os.environ.get("SENSEI_RUN_QUEUE_DEPTH", "64"))
+compile_pool = ThreadPoolExecutor(max_workers=RUN_WORKERS, thread_name_prefix="sensei-compile")
+run_queue = AdmissionQueue(RUN_WORKERS, RUN_QUEUE_DEPTH)
+
+# Per-run CPU/wall/memory/process/output limits (SENSEI_CPU_SECONDS etc.)
+run_limits = sandbox.Limits.from_env()
+
+# Syntax-only checks are cheap but still a g++ each; keep them to one per core
+DIAGNOSTICS_DEBOUNCE = float(os.environ.get("SENSEI_DIAGNOSTICS_DEBOUNCE", "0.3"))
+diagnostics_slots = asyncio.Semaphore(RUN_WORKERS)
+
+# Judge mode runs test cases in parallel, one sandboxed process per core
+judge_pool = ThreadPoolExecutor(max_workers=RUN_WORKERS, thread_name_prefix="sensei-judge")
+MAX_JUDGE_CASES = int(os.environ.get("SENSEI_MAX_JUDGE_CASES", "200"))
 
 # Enable CORS
 app.add_middleware(
@@ -19,17 +83,290 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Request ids, latency histograms and one JSON log line per request (see metrics.py)
+app.add_middleware(metrics.RequestMetrics)
 
 class ExplanationRequest(BaseModel):
     line: str
 
+class BatchLine(BaseModel):
+    line_no: int
+    line: str
+
+class BatchExplanationRequest(BaseModel):
+    # Either a whole source file or an explicit list of numbered lines
+    code: Optional[str] = None
+    lines: Optional[List[BatchLine]] = None
+
+def explain_etag(line: str) -> str:
+    # An explanation only changes with the line or the rule table
+    return f'"{sensei.rules_fingerprint}-{hashlib.sha256(line.encode("utf-8")).hexdigest()[:16]}"'
+
 @app.post("/explain")
-async def explain_line(req: ExplanationRequest):
-    explanation = sensei.explain_line(req.line)
+async def explain_line(req: ExplanationRequest, response: Response):
+    with metrics.EXPLAIN_SECONDS.time(endpoint="explain"):
+        explanation = sensei.explain_line(req.line)
+    response.headers["ETag"] = explain_etag(req.line)
     return {"explanation": explanation}
 
+@app.get("/explain")
+async def explain_line_cacheable(request: Request, line: str):
+    """GET form of /explain that browsers can cache: revalidated by ETag, 304 while the rules are unchanged."""
+    headers = {"ETag": explain_etag(line), "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    with metrics.EXPLAIN_SECONDS.time(endpoint="explain"):
+        explanation = sensei.explain_line(line)
+    return JSONResponse({"explanation": explanation}, headers=headers)
+
+@app.get("/explain/cache")
+async def explain_cache_stats():
+    return sensei.cache_stats()
+
+def request_lines(req: BatchExplanationRequest):
+    """(line_no, text) pairs for a batch request, or a 400."""
+    lines = None if req.lines is None else [(item.line_no, item.line) for item in req.lines]
+    try:
+        return batch_lines(req.code, lines)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/explain/batch")
+async def explain_batch(req: BatchExplanationRequest):
+    with metrics.EXPLAIN_SECONDS.time(endpoint="batch"):
+        explanations = list(sensei.explain_many(request_lines(req)))
+    return {"explanations": explanations}
+
+@app.post("/explain/stream")
+async def explain_stream(req: BatchExplanationRequest):
+    items = request_lines(req)
+    # NDJSON: one explanation per line, flushed as soon as it is ready
+    def generate():
+        with metrics.EXPLAIN_SECONDS.time(endpoint="stream"):
+            for result in sensei.explain_many(items):
+                yield json.dumps(result) + "\n"
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+class FileExplanationRequest(BaseModel):
+    code: str
+
+@app.post("/explain/file")
+def explain_file(req: FileExplanationRequest):
+    # Plain def: FastAPI runs it on its threadpool, so a big file doesn't stall the event loop
+    with metrics.EXPLAIN_SECONDS.time(endpoint="file"):
+        constructs = file_analyzer.analyze(req.code)
+    return {"constructs": [c._asdict() for c in constructs]}
+
+SERVER_BUSY = "Server busy: too many programs are waiting to run. Please try again in a moment."
+
+async def compile_queued(code: str, on_position=None, on_start=None, flags=(), timings=None):
+    """
+    Compiles through the admission queue on the compile pool. Identical
+    source + compiler + flags reuses the cached binary. Raises QueueFull.
+    Queue wait and compile time are recorded, and copied into `timings` if given.
+    """
+    loop = asyncio.get_running_loop()
+    queued = time.perf_counter()
+    try:
+        async with run_queue.slot(on_position):
+            admitted = time.perf_counter()
+            metrics.QUEUE_WAIT_SECONDS.observe(admitted - queued)
+            if on_start:
+                await on_start()
+            started = time.perf_counter()
+            comp = await loop.run_in_executor(compile_pool, build_cache.compile, code, flags)
+    except QueueFull:
+        metrics.FAILURES.inc(stage="queue", reason="full")
+        raise
+    compiled = time.perf_counter()
+
+    result = "cached" if comp.cached else "ok" if comp.ok else "error"
+    metrics.COMPILE_SECONDS.observe(compiled - started, result=result)
+    if not comp.ok:
+        metrics.FAILURES.inc(stage="compile", reason="error")
+    if timings is not None:
+        timings.update(queue_wait_ms=round((admitted - queued) * 1000, 2),
+                       compile_ms=round((compiled - started) * 1000, 2), compile=result)
+    return comp
+
+class DiagnosticsRequest(BaseModel):
+    code: str
+
+async def run_diagnostics(code: str):
+    async with diagnostics_slots:
+        found = await diagnostics.check_async(code)
+    return [d._asdict() for d in found]
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.post("/diagnostics")
+async def diagnostics_endpoint(req: DiagnosticsRequest):
+    return {"diagnostics": await run_diagnostics(req.code)}
+
+@app.websocket("/ws/diagnostics")
+async def diagnostics_socket(websocket: WebSocket):
+    """
+    Live checking while typing: the client sends the whole buffer on every
+    change. Bursts are debounced, and a newer buffer cancels the check in flight.
+    """
+    await websocket.accept()
+    pending = None
+
+    async def check_later(code, version):
+        await asyncio.sleep(DIAGNOSTICS_DEBOUNCE)
+        found = await run_diagnostics(code)
+        await websocket.send_json({"version": version, "diagnostics": found})
+
+    version = 0
+    try:
+        while True:
+            code = await websocket.receive_text()
+            version += 1
+            if pending is not None:
+                pending.cancel()
+            pending = asyncio.ensure_future(check_later(code, version))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if pending is not None:
+            pending.cancel()
+
+class JudgeCase(BaseModel):
+    input: str = ""
+    expected: Optional[str] = None  # omit to just run and report
+    time_limit: Optional[float] = Field(None, gt=0, le=10)
+    memory_limit_mb: Optional[int] = Field(None, ge=16, le=1024)
+
+class JudgeRequest(BaseModel):
+    code: str
+    cases: List[JudgeCase]
+    time_limit: float = Field(2.0, gt=0, le=10)      # per case, CPU seconds
+    memory_limit_mb: int = Field(256, ge=16, le=1024)
+
+@app.post("/judge")
+async def judge_endpoint(req: JudgeRequest):
+    """
+    Compiles once, then runs every case in parallel on the judge pool.
+    Streams NDJSON: a compile line, one line per case as it finishes, then a summary.
+    """
+    if not req.cases:
+        raise HTTPException(status_code=400, detail="Provide at least one test case")
+    if len(req.cases) > MAX_JUDGE_CASES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_JUDGE_CASES} test cases per request")
+
+    async def generate():
+        try:
+            comp = await compile_queued(req.code)
+        except QueueFull:
+            yield json.dumps({"type": "error", "message": SERVER_BUSY}) + "\n"
+            return
+        yield json.dumps({"type": "compile", "ok": comp.ok, "stderr": comp.stderr, "cached": comp.cached}) + "\n"
+        if not comp.ok:
+            return
+
+        loop = asyncio.get_running_loop()
+        pending = [
+            loop.run_in_executor(
+                judge_pool, judge.run_case, i, comp.exe, case.input, case.expected,
+                case.time_limit or req.time_limit, case.memory_limit_mb or req.memory_limit_mb, run_limits,
+                scratch_root)
+            for i, case in enumerate(req.cases)
+        ]
+        verdicts = {}
+        try:
+            for next_done in asyncio.as_completed(pending):
+                result = await next_done
+                verdicts[result.verdict] = verdicts.get(result.verdict, 0) + 1
+                metrics.RUN_SECONDS.observe(result.wall_time, endpoint="judge")
+                metrics.RUN_CPU_SECONDS.observe(result.time, endpoint="judge")
+                yield json.dumps({"type": "case", **result._asdict()}) + "\n"
+        finally:
+            for fut in pending:
+                fut.cancel()  # client went away: don't start the cases still queued
+
+        yield json.dumps({"type": "summary", "total": len(req.cases),
+                          "passed": verdicts.get("AC", 0), "verdicts": verdicts}) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+async def forward_stdin(websocket: WebSocket, process) -> bool:
+    """
+    Pipes client messages into the program's stdin until it exits.
+    Returns False if the client disconnected first.
+    """
+    exited = asyncio.ensure_future(process.wait())
+    try:
+        while True:
+            incoming = asyncio.ensure_future(websocket.receive())
+            done, _ = await asyncio.wait({exited, incoming}, return_when=asyncio.FIRST_COMPLETED)
+            if incoming not in done:
+                incoming.cancel()
+                return True
+
+            message = incoming.result()
+            if message["type"] == "websocket.disconnect":
+                return False
+            user_input = message.get("text")
+            if user_input and process.returncode is None:
+                try:
+                    process.stdin.write((user_input + "\n").encode())
+                    await process.stdin.drain()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # program closed stdin or just exited; exit is picked up next round
+            if exited.done():
+                return True
+    finally:
+        exited.cancel()
+
+def compare_builds(data: dict):
+    """(label, flags) for each build in compare mode, slowest level first. Raises ValueError."""
+    levels = {build_flags(data.get("opt") or "-O0")[0], build_flags(data["compare"])[0]}
+    if len(levels) < 2:
+        raise ValueError("Compare needs two different optimization levels")
+    return [(level, build_flags(level, data.get("std"))) for level in sorted(levels, key=OPT_LEVELS.index)]
+
+async def run_compare(websocket: WebSocket, code: str, builds, stdin: str, report_position):
+    """
+    Compare mode: the same program built at each level and run one after the
+    other (not side by side, so they don't steal CPU from each other), then a
+    side-by-side report and the performance coach's tips. Returns False if it didn't compile.
+    """
+    loop = asyncio.get_running_loop()
+    measured = []
+    for label, flags in builds:
+        await websocket.send_text(f"Compiling at {label}...\n")
+        comp = await compile_queued(code, report_position, flags=flags)
+        if not comp.ok:
+            await websocket.send_text("Compilation Error:\n" + comp.stderr)
+            return False
+        await websocket.send_text(f"Running at {label}...\n")
+        with sandbox.scratch_dir(scratch_root) as workdir:
+            out, err, usage = await loop.run_in_executor(
+                judge_pool, sandbox.run, comp.exe, run_limits, workdir, stdin.encode())
+        metrics.record_run("compare", usage, len(out) + len(err))
+        measured.append(coach.Measured(label, usage, out.decode("utf-8", errors="replace")))
+        if len(measured) == 1:
+            # The output only needs showing once; the report says if the other build disagreed
+            await websocket.send_text(measured[0].output + err.decode("utf-8", errors="replace"))
+
+    await websocket.send_text("\n" + coach.compare_report(measured, run_limits) + "\n")
+    tips = coach.format_tips(performance_coach.tips(code))
+    if tips:
+        await websocket.send_text("\n" + tips + "\n")
+    factor = coach.speedup(measured[0], measured[-1])
+    result = f"{factor:.2f}x faster at {measured[-1].label}" if factor else "too quick to compare"
+    await websocket.send_text(f"\n[Program Finished] {' vs '.join(m.label for m in measured)}: {result}")
+    return True
+
 @app.websocket("/ws/run")
 async def websocket_endpoint(websocket: WebSocket):
+    """
+    Compiles and runs one program. The first message is JSON: {"code", "opt"?, "std"?}
+    with opt one of -O0/-O2/-O3 and std c++17/c++20. Adding "compare": "-O2" (and
+    optionally "input" for stdin) runs compare mode instead of an interactive run.
+    """
     await websocket.accept()
     
     # Receive the code first
@@ -41,85 +378,115 @@ async def websocket_endpoint(websocket: WebSocket):
         await websocket.close()
         return
 
-    # Setup files
-    file_id = str(uuid.uuid4())
-    src_file = f"temp_{file_id}.cpp"
-    exe_file = f"temp_{file_id}.exe"
-    
     try:
-        with open(src_file, "w") as f:
-            f.write(code)
-            
+        flags = build_flags(data.get("opt"), data.get("std"))
+        builds = compare_builds(data) if data.get("compare") else None
+    except ValueError as e:
+        await websocket.send_text(f"Error: {e}")
+        await websocket.close()
+        return
+
+    async def report_position(position):
+        await websocket.send_text(f"Queued: position {position} in line...\n")
+
+    async def report_compiling():
         await websocket.send_text("Compiling...\n")
-        
-        comp = subprocess.run(['g++', src_file, '-o', exe_file], capture_output=True, text=True)
-        
-        if comp.returncode != 0:
+
+    rid = metrics.request_id(websocket)
+    timings = {}
+    outcome = "error"
+    try:
+        try:
+            if builds:
+                finished = await run_compare(websocket, code, builds, data.get("input") or "", report_position)
+                outcome = "compare" if finished else "compile_error"
+                return
+            comp = await compile_queued(code, report_position, report_compiling, flags=flags, timings=timings)
+        except QueueFull:
+            outcome = "busy"
+            await websocket.send_text(SERVER_BUSY + "\n")
+            return
+
+        if not comp.ok:
+            outcome = "compile_error"
             await websocket.send_text("Compilation Error:\n" + comp.stderr)
             await websocket.close()
             return
+        exe_file = comp.exe
             
         await websocket.send_text("Running...\n")
         
-        # Start Process
-        process = subprocess.Popen(
-            [exe_file],
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            bufsize=0 # Unbuffered
-        )
-        
-        # Helper to read stream and send to WS
-        def stream_reader(pipe, prefix=""):
-            try:
-                while True:
-                    # Read 1 character at a time to handle prompts without newlines (e.g. "Enter name: ")
-                    chunk = pipe.read(1) 
-                    if not chunk:
-                        break
-                    asyncio.run_coroutine_threadsafe(websocket.send_text(prefix + chunk), loop)
-            except Exception:
-                pass
-
-        loop = asyncio.get_event_loop()
-        
-        # Start threads for stdout and stderr
-        threading.Thread(target=stream_reader, args=(process.stdout,), daemon=True).start()
-        threading.Thread(target=stream_reader, args=(process.stderr, "Error: "), daemon=True).start()
-        
-        # Main loop: Listen for input from Client
-        try:
-            while process.poll() is None:
-                # Wait for input from user (browser) with a timeout
-                try:
-                    user_input = await asyncio.wait_for(websocket.receive_text(), timeout=0.1)
-                    if user_input:
-                        process.stdin.write(user_input + "\n")
-                        process.stdin.flush()
-                except asyncio.TimeoutError:
-                    continue
-                except Exception:
-                    break
-                    
-        except Exception as e:
-            pass
-            
-        await websocket.send_text("\n[Program Finished]")
-        
+        # Start the program in its own scratch directory, under resource limits
+        with sandbox.scratch_dir(scratch_root) as workdir:
+            process = await sandbox.start(exe_file, run_limits, workdir)
+
+            # Output is read in whatever chunks are available and sent as a few
+            # coalesced frames; the pump kills the program if it prints too much
+            output = OutputPump(websocket.send_text, on_limit=lambda: process.kill(limit="output"),
+                                max_total=run_limits.output_bytes)
+            pumps = asyncio.gather(
+                output.pump(process.stdout),
+                output.pump(process.stderr, "Error: "),
+            )
+
+            # Main loop: sleep until either the program exits or the client sends
+            # something. No polling, so an idle session costs nothing.
+            connected = await forward_stdin(websocket, process)
+            if not connected:
+                process.kill()  # the client went away mid-run
+                output.detach()
+            usage = await process.wait()
+
+            # Everything the program printed goes out before the finish marker
+            await pumps
+            await output.close()
+
+        metrics.record_run("ws_run", usage, output.total, timings)
+        outcome = "disconnected" if not connected else usage.limit or "finished"
+        if not connected:
+            return
+        stopped = usage.limit_message(run_limits)
+        if stopped:
+            await websocket.send_text(f"\n[Stopped: {stopped}]")
+        await websocket.send_text(f"\n[Program Finished] {usage.describe()}")
+
+    except WebSocketDisconnect:
+        outcome = "disconnected"
     except Exception as e:
+        metrics.FAILURES.inc(stage="server", reason=type(e).__name__)
         await websocket.send_text(f"Server Error: {str(e)}")
     finally:
-        await websocket.close()
-        # Cleanup
-        if os.path.exists(src_file):
-            try: os.remove(src_file)
-            except: pass
-        if os.path.exists(exe_file):
-            try: os.remove(exe_file)
-            except: pass
+        metrics.log_event(rid, "run", endpoint="/ws/run", outcome=outcome, **timings)
+        if websocket.client_state == WebSocketState.CONNECTED:
+            await websocket.close()
+
+@app.websocket("/ws/session")
+async def session_endpoint(websocket: WebSocket):
+    """One persistent, multiplexed connection for explain/diagnostics/compile/run (see session.py)."""
+    await websocket.accept()
+    await Session(websocket, sensei, compile_queued, run_diagnostics, run_limits, SERVER_BUSY,
+                  scratch_root).serve()
+
+# The web frontend itself, compressed once at startup (see static_assets.py)
+frontend = StaticFrontend(os.path.dirname(os.path.abspath(__file__)))
+
+@app.api_route("/", methods=["GET", "HEAD"], include_in_schema=False)
+async def index_page(request: Request):
+    return frontend.response(request, "/")
+
+@app.api_route("/public/{name}", methods=["GET", "HEAD"], include_in_schema=False)
+async def public_file(request: Request, name: str):
+    return frontend.response(request, f"/public/{name}")
+
+@app.api_route("/favicon.ico", methods=["GET", "HEAD"], include_in_schema=False)
+@app.api_route("/robots.txt", methods=["GET", "HEAD"], include_in_schema=False)
+async def root_file(request: Request):
+    return frontend.response(request, request.url.path)
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    if WEB_WORKERS > 1:
+        # Separate processes sharing the port; each re-imports this module
+        uvicorn.run("server:app", host="0.0.0.0", port=8000, workers=WEB_WORKERS)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,261 @@
+import asyncio
+import json
+import os
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from admission import QueueFull
+from compiler import build_flags
+from logic import batch_lines
+from streaming import OutputPump
+import metrics
+import sandbox
+
+MAX_IN_FLIGHT = 16  # concurrent operations per connection
+MAX_PENDING_STDIN = 64  # stdin messages waiting for a program that isn't reading
+
+
+class Session:
+    """
+    One long-lived, multiplexed connection (/ws/session).
+
+    Client messages are JSON objects with a "type" and an "id" chosen by the
+    client; every reply carries the same id, so several operations can be in
+    flight at once:
+
+        explain      {code} or {lines: [{line_no, line}]} -> "explanation"... then "done"
+        diagnostics  {code}      -> "diagnostics" (a newer request cancels the older one)
+        compile      {code, opt?, std?}  -> "queued"..., "compile"
+        run          {code?, opt?, std?} -> "queued"..., "compile", "output"..., "exit"
+                                    (no code: reuse the last compiled program)
+        stdin        {data}      -> forwarded to the run with this id
+        cancel                   -> stops the operation with this id ("cancelled")
+
+    The last binary is reused between actions; explanations come from
+    SenseiLogic's own cache.
+    """
+
+    def __init__(self, websocket: WebSocket, sensei, compile_queued, diagnose,
+                 run_limits: sandbox.Limits, server_busy: str, scratch_root: str = None):
+        self.websocket = websocket
+        self.sensei = sensei
+        self.compile_queued = compile_queued
+        self.diagnose = diagnose
+        self.run_limits = run_limits
+        self.server_busy = server_busy
+        self.scratch_root = scratch_root
+        self.last_code = None
+        self.last_flags = ()
+        self.last_compile = None
+        self.tasks = {}
+        self.runs = {}
+        self._diagnostics_id = None
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, rid, kind: str, **fields):
+        async with self._send_lock:
+            await self.websocket.send_json({"id": rid, "type": kind, **fields})
+
+    async def serve(self):
+        try:
+            while True:
+                try:
+                    msg = json.loads(await self.websocket.receive_text())
+                except ValueError:
+                    await self.send(None, "error", message="Messages must be JSON objects")
+                    continue
+                if not isinstance(msg, dict):
+                    await self.send(None, "error", message="Messages must be JSON objects")
+                    continue
+                await self.dispatch(msg)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            for task in list(self.tasks.values()):
+                task.cancel()
+
+    async def dispatch(self, msg: dict):
+        rid = msg.get("id")
+        kind = msg.get("type")
+        if rid is None:
+            await self.send(None, "error", message="Every message needs an 'id'")
+            return
+        # Ids key our task tables, so nothing unhashable (and no true/false, which equal 1/0)
+        if not isinstance(rid, (str, int)) or isinstance(rid, bool):
+            await self.send(None, "error", message="'id' must be a string or an integer")
+            return
+        if not isinstance(kind, str):
+            await self.send(rid, "error", message="'type' must be a string")
+            return
+
+        if kind == "stdin":
+            pending = self.runs.get(rid)
+            if pending is None:
+                await self.send(rid, "error", message="No running program with this id")
+                return
+            data = msg.get("data", "")
+            if not isinstance(data, str):
+                await self.send(rid, "error", message="'data' must be a string")
+                return
+            # Queued for the run's own writer: a program that doesn't read must
+            # not hold up this loop (and with it cancel and every other id)
+            try:
+                pending.put_nowait((data + "\n").encode())
+            except asyncio.QueueFull:
+                await self.send(rid, "error", message="The program isn't reading its input")
+            return
+
+        if kind == "cancel":
+            task = self.tasks.get(rid)
+            if task is not None:
+                task.cancel()
+            return
+
+        handler = {
+            "explain": self.explain,
+            "diagnostics": self.diagnostics,
+            "compile": self.compile,
+            "run": self.run,
+        }.get(kind)
+        if handler is None:
+            await self.send(rid, "error", message=f"Unknown message type {kind!r}")
+            return
+        if rid in self.tasks:
+            await self.send(rid, "error", message="This id is already in use")
+            return
+        if len(self.tasks) >= MAX_IN_FLIGHT:
+            await self.send(rid, "error", message="Too many operations in flight on this connection")
+            return
+
+        if kind == "diagnostics" and self._diagnostics_id in self.tasks:
+            # Only the newest buffer matters while typing
+            self.tasks[self._diagnostics_id].cancel()
+            self._diagnostics_id = None
+        if kind == "diagnostics":
+            self._diagnostics_id = rid
+        self.tasks[rid] = asyncio.ensure_future(self._guard(rid, handler(rid, msg)))
+
+    async def _guard(self, rid, work):
+        try:
+            await work
+        except asyncio.CancelledError:
+            await self._try_send(rid, "cancelled")
+        except QueueFull:
+            await self._try_send(rid, "error", message=self.server_busy)
+        except ValueError as e:
+            await self._try_send(rid, "error", message=str(e))  # bad request: options, nothing to rerun
+        except Exception as e:
+            metrics.FAILURES.inc(stage="server", reason=type(e).__name__)
+            await self._try_send(rid, "error", message=f"Server Error: {e}")
+        finally:
+            self.tasks.pop(rid, None)
+
+    async def _try_send(self, rid, kind: str, **fields):
+        try:
+            await self.send(rid, kind, **fields)
+        except Exception:
+            pass  # the client is already gone
+
+    # --- Handlers ---
+
+    async def explain(self, rid, msg: dict):
+        code, lines = msg.get("code"), msg.get("lines")
+        if code is not None and not isinstance(code, str):
+            raise ValueError("'code' must be a string")
+        if lines is not None:
+            if not isinstance(lines, list) or not all(
+                    isinstance(item, dict) and isinstance(item.get("line_no"), int)
+                    and isinstance(item.get("line"), str) for item in lines):
+                raise ValueError("'lines' must be a list of {line_no, line}")
+            lines = [(item["line_no"], item["line"]) for item in lines]
+        items = batch_lines(code, lines)
+        with metrics.EXPLAIN_SECONDS.time(endpoint="session"):
+            results = list(self.sensei.explain_many(items))
+        for result in results:
+            await self.send(rid, "explanation", **result)
+        await self.send(rid, "done")
+
+    async def diagnostics(self, rid, msg: dict):
+        await self.send(rid, "diagnostics", diagnostics=await self.diagnose(msg.get("code", "")))
+
+    async def _compile(self, rid, msg: dict, timings: dict = None):
+        code = msg.get("code")
+        flags = build_flags(msg.get("opt"), msg.get("std"))
+        if code is None and self.last_compile is None:
+            raise ValueError("Nothing has been compiled on this connection yet")
+        if code is None:
+            code = self.last_code
+        # The binary cache may have evicted it since; then just build it again
+        if (code, flags) == (self.last_code, self.last_flags) and os.path.exists(self.last_compile.exe):
+            return self.last_compile._replace(cached=True)
+
+        async def report_position(position):
+            await self.send(rid, "queued", position=position)
+
+        comp = await self.compile_queued(code, report_position, flags=flags, timings=timings)
+        if comp.ok:
+            self.last_code, self.last_flags, self.last_compile = code, flags, comp
+        return comp
+
+    async def compile(self, rid, msg: dict):
+        comp = await self._compile(rid, msg)
+        await self.send(rid, "compile", ok=comp.ok, stderr=comp.stderr, cached=comp.cached)
+
+    async def run(self, rid, msg: dict):
+        timings = {"compile": "reused"}  # overwritten if it really goes through the queue
+        comp = await self._compile(rid, msg, timings)
+        if not comp.ok:
+            await self.send(rid, "compile", ok=False, stderr=comp.stderr, cached=comp.cached)
+            return
+
+        # Accept stdin from the moment the client hears it compiled; it's held
+        # here until the program has started
+        pending = asyncio.Queue(MAX_PENDING_STDIN)
+        self.runs[rid] = pending
+        try:
+            await self.send(rid, "compile", ok=True, stderr=comp.stderr, cached=comp.cached)
+            with sandbox.scratch_dir(self.scratch_root) as workdir:
+                process = await sandbox.start(comp.exe, self.run_limits, workdir)
+                feeder = asyncio.ensure_future(self._feed_stdin(process, pending))
+
+                async def send_output(text):
+                    await self.send(rid, "output", data=text)
+
+                output = OutputPump(send_output, on_limit=lambda: process.kill(limit="output"),
+                                    max_total=self.run_limits.output_bytes)
+                pumps = asyncio.gather(output.pump(process.stdout), output.pump(process.stderr, "Error: "))
+                try:
+                    usage = await process.wait()
+                    await pumps
+                    await output.close()
+                except asyncio.CancelledError:
+                    process.kill()
+                    output.detach()
+                    usage = await process.wait()
+                    await pumps
+                    self._record_run(rid, usage, output, timings, "cancelled")
+                    raise
+                finally:
+                    feeder.cancel()
+        finally:
+            self.runs.pop(rid, None)
+
+        self._record_run(rid, usage, output, timings, usage.limit or "finished")
+
+        await self.send(rid, "exit", stopped=usage.limit_message(self.run_limits),
+                        summary=usage.describe(), **usage._asdict())
+
+    @staticmethod
+    async def _feed_stdin(process, pending: asyncio.Queue):
+        while True:
+            data = await pending.get()
+            try:
+                process.stdin.write(data)
+                await process.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                return  # program closed stdin or exited
+
+    def _record_run(self, rid, usage, output: OutputPump, timings: dict, outcome: str):
+        metrics.record_run("session", usage, output.total, timings)
+        metrics.log_event(metrics.request_id(self.websocket), "run", endpoint="/ws/session",
+                          message_id=rid, outcome=outcome, **timings)
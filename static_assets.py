@@ -0,0 +1,137 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+from typing import Dict, NamedTuple, Optional
+
+try:
+    import brotli  # optional; without it only gzip variants are made
+except ImportError:
+    brotli = None
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+# Hashed URLs never change content, so browsers may keep them for a year
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Everything else (the page itself, unversioned URLs) is revalidated: a 304 costs a few bytes
+REVALIDATE = "no-cache"
+
+COMPRESSIBLE = ("text/", "application/javascript", "application/json", "image/svg+xml")
+MIN_COMPRESS_BYTES = 512
+ROOT_FILES = ("favicon.ico", "robots.txt")  # fetched from / by browsers and crawlers
+
+
+class Asset(NamedTuple):
+    media_type: str
+    digest: str                     # content hash, used in ETags and ?v= URLs
+    bodies: Dict[str, bytes]        # "identity", and "gzip"/"br" when they're smaller
+
+
+def _compress(body: bytes, media_type: str) -> Dict[str, bytes]:
+    bodies = {"identity": body}
+    if len(body) < MIN_COMPRESS_BYTES or not media_type.startswith(COMPRESSIBLE):
+        return bodies
+    # mtime=0 keeps the gzip bytes (and so the ETag) identical across restarts and workers
+    variants = {"gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(body, quality=11)
+    bodies.update((enc, data) for enc, data in variants.items() if len(data) < len(body))
+    return bodies
+
+
+def _accepted(header: str) -> Dict[str, float]:
+    """Accept-Encoding -> {coding: q}; a missing q means 1."""
+    accepted = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = re.search(r"q\s*=\s*([\d.]+)", params)
+        try:
+            accepted[coding.strip().lower()] = float(q.group(1)) if q else 1.0
+        except ValueError:
+            continue
+    return accepted
+
+
+def choose_encoding(asset: Asset, accept_encoding: str) -> str:
+    accepted = _accepted(accept_encoding or "")
+    for coding in ("br", "gzip"):
+        q = accepted.get(coding, accepted.get("*", 0))
+        if coding in asset.bodies and q > 0:
+            return coding
+    return "identity"
+
+
+def _opaque(tag: str) -> str:
+    return tag.strip().removeprefix("W/")
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match uses weak comparison, so W/"x" matches "x"."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return _opaque(etag) in {_opaque(tag) for tag in if_none_match.split(",")}
+
+
+class StaticFrontend:
+    """
+    The web frontend (index.html + public/), loaded and compressed once at startup.
+
+    Each file gets a content hash. index.html is rewritten to point at
+    /public/<file>?v=<hash>, and those exact URLs are served as immutable, so a
+    returning browser doesn't even ask for them until they change. The page
+    itself is revalidated with its ETag (a 304 when nothing changed).
+    Responses come precompressed (brotli when installed, else gzip) per Accept-Encoding.
+    """
+
+    def __init__(self, root: str, index: str = "index.html", public: str = "public"):
+        self.assets: Dict[str, Asset] = {}
+        public_dir = os.path.join(root, public)
+        for name in sorted(os.listdir(public_dir)) if os.path.isdir(public_dir) else []:
+            path = os.path.join(public_dir, name)
+            if os.path.isfile(path):
+                with open(path, "rb") as f:
+                    self.assets[f"/{public}/{name}"] = self._asset(name, f.read())
+        for name in ROOT_FILES:
+            if f"/{public}/{name}" in self.assets:
+                self.assets[f"/{name}"] = self.assets[f"/{public}/{name}"]
+
+        index_path = os.path.join(root, index)
+        if os.path.isfile(index_path):
+            with open(index_path, "rb") as f:
+                html = f.read().decode("utf-8")
+            for url, asset in self.assets.items():
+                # href="public/x.css" or "/public/x.css" -> "/public/x.css?v=<hash>"
+                html = re.sub(r'(["\'])/?' + re.escape(url.lstrip("/")) + r'\1',
+                              lambda m: f"{m.group(1)}{url}?v={asset.digest}{m.group(1)}", html)
+            self.assets["/"] = self._asset(index, html.encode("utf-8"))
+
+    @staticmethod
+    def _asset(filename: str, body: bytes) -> Asset:
+        media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        if media_type.startswith("text/") or media_type.endswith("javascript"):
+            media_type += "; charset=utf-8"
+        return Asset(media_type, hashlib.sha256(body).hexdigest()[:16], _compress(body, media_type))
+
+    def response(self, request: Request, url: str) -> Response:
+        asset = self.assets.get(url)
+        if asset is None:
+            return Response("Not Found", status_code=404, media_type="text/plain")
+
+        encoding = choose_encoding(asset, request.headers.get("accept-encoding"))
+        # One ETag per encoded body, as the bytes on the wire differ
+        etag = f'"{asset.digest}"' if encoding == "identity" else f'"{asset.digest}-{encoding}"'
+        versioned = request.query_params.get("v") == asset.digest
+        headers = {
+            "ETag": etag,
+            "Cache-Control": IMMUTABLE if versioned else REVALIDATE,
+            "Vary": "Accept-Encoding",
+        }
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(asset.bodies[encoding], media_type=asset.media_type, headers=headers)
@@ -0,0 +1,109 @@
+import asyncio
+import codecs
+from typing import Awaitable, Callable, Optional
+
+FLUSH_INTERVAL = 0.02          # seconds; short enough that "Enter name: " shows up at once
+MAX_FRAME_BYTES = 16 * 1024    # flush early once this much is buffered
+MAX_OUTPUT_BYTES = 1024 * 1024 # per run; runaway print loops get stopped here
+READ_SIZE = 64 * 1024
+
+
+class OutputPump:
+    """
+    Coalesces a process's stdout/stderr into a few websocket frames.
+
+    Each pipe is read in whatever chunks are available, buffered, and flushed
+    on a short timer or when the buffer gets big. Sends are awaited, so a slow
+    client stops us reading, the pipe fills up and the program blocks on its
+    next write: natural back-pressure instead of an unbounded queue.
+    """
+
+    def __init__(self, send: Callable[[str], Awaitable[None]],
+                 on_limit: Optional[Callable[[], None]] = None,
+                 flush_interval: float = FLUSH_INTERVAL,
+                 max_frame: int = MAX_FRAME_BYTES,
+                 max_total: int = MAX_OUTPUT_BYTES):
+        self.send = send
+        self.on_limit = on_limit
+        self.flush_interval = flush_interval
+        self.max_frame = max_frame
+        self.max_total = max_total
+        self.total = 0
+        self.truncated = False
+        self.detached = False
+        self._parts = []
+        self._buffered = 0
+        self._timer = None
+        self._send_lock = asyncio.Lock()
+
+    async def pump(self, stream: asyncio.StreamReader, prefix: str = ""):
+        """Reads one pipe until EOF."""
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        while True:
+            data = await stream.read(READ_SIZE)
+            if not data:
+                break
+            if self.truncated:
+                continue  # keep draining so the writer never blocks on a full pipe
+
+            if self.total + len(data) > self.max_total:
+                data = data[:self.max_total - self.total]
+                self.truncated = True
+            self.total += len(data)
+
+            text = decoder.decode(data)
+            if text:
+                self._add(prefix, text)
+
+            if self.truncated:
+                self._add("", f"\n[Output limit of {self.max_total // 1024} KB reached, program stopped]\n")
+                if self.on_limit:
+                    self.on_limit()
+                await self.flush()
+            elif self._buffered >= self.max_frame:
+                await self.flush()
+            elif self._timer is None:
+                self._timer = asyncio.ensure_future(self._flush_later())
+
+        tail = decoder.decode(b"", final=True)
+        if tail and not self.truncated:
+            self._add(prefix, tail)
+
+    def _add(self, prefix: str, text: str):
+        # Consecutive chunks from the same pipe share one prefix
+        if self._parts and self._parts[-1][0] == prefix:
+            self._parts[-1][1].append(text)
+        else:
+            self._parts.append((prefix, [text]))
+        self._buffered += len(text)
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        self._timer = None
+        await self.flush()
+
+    async def flush(self):
+        async with self._send_lock:
+            if not self._parts:
+                return
+            frame = "".join(prefix + "".join(chunks) for prefix, chunks in self._parts)
+            self._parts = []
+            self._buffered = 0
+            if self.detached:
+                return
+            try:
+                await self.send(frame)
+            except Exception:
+                # Client is gone; keep draining the pipes but stop sending
+                self.detach()
+
+    def detach(self):
+        """Stops sending (e.g. after a disconnect) while still draining the pipes."""
+        self.detached = True
+
+    async def close(self):
+        """Sends whatever is still buffered. Call after every pump() has finished."""
+        await self.flush()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
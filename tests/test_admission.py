@@ -0,0 +1,165 @@
+"""AdmissionQueue: slots, the waiting line, hand-off on release, and cancellation."""
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from admission import AdmissionQueue, QueueFull  # noqa: E402
+
+
+async def settle():
+    # Enough loop turns for woken waiters to run up to their next await
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def test_free_slots_are_taken_at_once():
+    async def main():
+        q = AdmissionQueue(2, 5)
+        await q.acquire()
+        await q.acquire()
+        assert (q.active, q.waiting) == (2, 0)
+        q.release()
+        q.release()
+        assert q.active == 0
+    asyncio.run(main())
+
+
+def test_queue_full_beyond_max_waiting():
+    async def main():
+        q = AdmissionQueue(1, 2)
+        await q.acquire()
+        waiters = [asyncio.ensure_future(q.acquire()) for _ in range(2)]
+        await settle()
+        assert q.waiting == 2
+        with pytest.raises(QueueFull):
+            await q.acquire()
+        assert q.waiting == 2  # the rejected caller never joined the line
+        for w in waiters:
+            w.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+    asyncio.run(main())
+
+
+def test_release_hands_the_slot_to_the_head_of_the_line():
+    async def main():
+        q = AdmissionQueue(1, 5)
+        await q.acquire()
+        admitted = []
+
+        async def job(name):
+            await q.acquire()
+            admitted.append(name)
+
+        tasks = [asyncio.ensure_future(job(n)) for n in "abc"]
+        await settle()
+        assert (q.active, q.waiting, admitted) == (1, 3, [])
+
+        q.release()
+        await settle()
+        # Handed over, not freed: a newcomer can't jump the line
+        assert (q.active, q.waiting, admitted) == (1, 2, ["a"])
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(q.acquire(), 0.05)
+
+        q.release()
+        q.release()
+        await settle()
+        assert admitted == ["a", "b", "c"]
+        q.release()
+        assert (q.active, q.waiting) == (0, 0)
+        await asyncio.gather(*tasks)
+    asyncio.run(main())
+
+
+def test_positions_are_reported_as_the_line_moves():
+    async def main():
+        q = AdmissionQueue(1, 5)
+        await q.acquire()
+        seen = {"a": [], "b": [], "c": []}
+
+        def reporter(name):
+            async def report(position):
+                seen[name].append(position)
+            return report
+
+        tasks = [asyncio.ensure_future(q.acquire(reporter(n))) for n in "abc"]
+        await settle()
+        assert seen == {"a": [1], "b": [2], "c": [3]}
+
+        tasks[1].cancel()  # leaving the line moves everyone behind it up
+        await settle()
+        assert seen == {"a": [1], "b": [2], "c": [3, 2]}
+
+        q.release()
+        await settle()
+        assert seen == {"a": [1], "b": [2], "c": [3, 2, 1]}
+        q.release()
+        await settle()
+        q.release()
+        assert q.active == 0
+        await asyncio.gather(*tasks, return_exceptions=True)
+    asyncio.run(main())
+
+
+def test_cancelled_while_waiting_leaves_the_line():
+    async def main():
+        q = AdmissionQueue(1, 5)
+        await q.acquire()
+        task = asyncio.ensure_future(q.acquire())
+        await settle()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert (q.active, q.waiting) == (1, 0)
+        q.release()
+        assert q.active == 0
+    asyncio.run(main())
+
+
+def test_cancelled_after_the_slot_was_granted_passes_it_on():
+    async def main():
+        q = AdmissionQueue(1, 5)
+        await q.acquire()
+        first = asyncio.ensure_future(q.acquire())
+        second = asyncio.ensure_future(q.acquire())
+        await settle()
+
+        q.release()       # grants `first` its slot...
+        first.cancel()    # ...but it's cancelled before it gets to run
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        await second      # so the slot went on to the next in line
+        assert (q.active, q.waiting) == (1, 0)
+
+        q.release()
+        assert q.active == 0
+    asyncio.run(main())
+
+
+def test_cancelled_after_grant_with_nobody_waiting_frees_the_slot():
+    async def main():
+        q = AdmissionQueue(1, 5)
+        await q.acquire()
+        task = asyncio.ensure_future(q.acquire())
+        await settle()
+        q.release()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert (q.active, q.waiting) == (0, 0)
+    asyncio.run(main())
+
+
+def test_slot_is_released_when_the_work_fails():
+    async def main():
+        q = AdmissionQueue(1, 5)
+        with pytest.raises(RuntimeError):
+            async with q.slot():
+                assert q.active == 1
+                raise RuntimeError("boom")
+        assert q.active == 0
+    asyncio.run(main())
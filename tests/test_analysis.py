@@ -0,0 +1,147 @@
+"""The tokenizer and FileAnalyzer: token spans, comments and strings, constructs that span lines."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analysis import FileAnalyzer, LineIndex, tokenize  # noqa: E402
+from logic import SenseiLogic  # noqa: E402
+
+
+def texts(code):
+    return [t.text for t in tokenize(code)]
+
+
+@pytest.fixture(scope="module")
+def analyzer():
+    return FileAnalyzer(SenseiLogic())
+
+
+# --- tokenize ---
+
+def test_token_spans_point_back_into_the_source():
+    code = 'int  x=a->b<<=2; // done\nstd::cout << "hi";\n'
+    tokens = list(tokenize(code))
+    assert [t.text for t in tokens] == ["int", "x", "=", "a", "->", "b", "<<=", "2", ";",
+                                        "std", "::", "cout", "<<", '"hi"', ";"]
+    for t in tokens:
+        assert code[t.start:t.end] == t.text
+    assert [t.spaced for t in tokens[:4]] == [False, True, False, False]
+    assert tokens[9].spaced  # after the comment and the newline
+
+
+def test_token_kinds():
+    kinds = [(t.kind, t.text) for t in tokenize("x = 1.5e-3 + 'a' + u8\"s\" + 0x1F'FF;")]
+    assert kinds == [("ident", "x"), ("punct", "="), ("number", "1.5e-3"), ("punct", "+"),
+                     ("char", "'a'"), ("punct", "+"), ("string", 'u8"s"'), ("punct", "+"),
+                     ("number", "0x1F'FF"), ("punct", ";")]
+
+
+def test_comments_are_skipped():
+    code = "a // b { c\n/* d;\n } */ e /* unterminated { ;"
+    assert texts(code) == ["a", "e"]
+
+
+def test_strings_and_chars_are_kept_whole():
+    code = r'''s = "a; { // not a comment \" }"; c = '}'; r = R"x(line ")" { */)x";'''
+    assert texts(code) == ["s", "=", r'"a; { // not a comment \" }"', ";",
+                           "c", "=", "'}'", ";",
+                           "r", "=", 'R"x(line ")" { */)x"', ";"]
+
+
+def test_raw_string_spans_lines():
+    code = 'auto r = R"(one\ntwo;)";\nint x;'
+    tokens = list(tokenize(code))
+    assert tokens[3].text == 'R"(one\ntwo;)"'
+    assert code[tokens[3].start:tokens[3].end] == tokens[3].text
+    assert [t.text for t in tokens[4:]] == [";", "int", "x", ";"]
+
+
+def test_directive_takes_the_rest_of_its_line():
+    tokens = list(tokenize("#  include <vector> // why\n#define N \\\n  10\nint x;"))
+    assert [(t.kind, t.text) for t in tokens[:2]] == [("pp", "#include <vector>"), ("pp", "#define N \\\n  10")]
+    assert [t.text for t in tokens[2:]] == ["int", "x", ";"]
+
+
+def test_line_index():
+    lines = LineIndex("ab\ncd\n\nx")
+    assert lines.position(0) == (1, 1)
+    assert lines.position(1) == (1, 2)
+    assert lines.position(3) == (2, 1)
+    assert lines.position(6) == (3, 1)
+    assert lines.position(7) == (4, 1)
+
+
+# --- FileAnalyzer ---
+
+SOURCE = '''#include <iostream>
+class Dog {
+public:
+    void speak() {
+        std::cout << "woof"   // a comment mid-statement
+                  << std::endl;
+        if (a &&
+            b) {
+            x++;
+        }
+    }
+};
+int a[] = {1,
+           2};
+'''
+
+
+def test_constructs_and_positions(analyzer):
+    found = [(c.kind, c.line, c.column, c.end_line, c.end_column, c.text, c.scope)
+             for c in analyzer.analyze(SOURCE)]
+    assert found == [
+        ("preprocessor", 1, 1, 1, 19, "#include <iostream>", ""),
+        ("block", 2, 1, 2, 11, "class Dog {", ""),
+        ("access", 3, 1, 3, 7, "public:", "class Dog"),
+        ("block", 4, 5, 4, 18, "void speak() {", "class Dog"),
+        ("statement", 5, 9, 6, 31, 'std::cout << "woof" << std::endl;', "class Dog > speak"),
+        ("control", 7, 9, 8, 14, "if (a && b)", "class Dog > speak"),
+        ("statement", 9, 13, 9, 16, "x++;", "class Dog > speak > if"),
+        ("statement", 13, 1, 14, 14, "int a[] = {1, 2};", ""),
+    ]
+
+
+def test_multi_line_constructs_get_the_rules_explanation(analyzer):
+    by_text = {c.text: c for c in analyzer.analyze(SOURCE)}
+    assert by_text['std::cout << "woof" << std::endl;'].summary.startswith("OUTPUT:")
+    assert by_text["if (a && b)"].summary.startswith("CONDITIONAL:")
+    assert by_text["int a[] = {1, 2};"].summary.startswith("INTEGER DECLARATION:")
+
+
+def test_nothing_inside_comments_or_strings_becomes_a_construct(analyzer):
+    code = ('/* if (x) { cout << 1; } */\n'
+            '// while (true) {\n'
+            'const char *s = "for (;;) { }";\n'
+            "char c = '{';\n"
+            'int y;\n')
+    found = [(c.kind, c.line, c.text) for c in analyzer.analyze(code)]
+    assert found == [
+        ("statement", 3, 'const char *s = "for (;;) { }";'),
+        ("statement", 4, "char c = '{';"),
+        ("statement", 5, "int y;"),
+    ]
+
+
+def test_else_if_and_braceless_bodies(analyzer):
+    code = "if (a) x = 1;\nelse if (b)\n    y = 2;\nelse\n    z = 3;\n"
+    found = [(c.kind, c.line, c.text) for c in analyzer.analyze(code)]
+    assert found == [
+        ("control", 1, "if (a)"),
+        ("statement", 1, "x = 1;"),
+        ("control", 2, "else if (b)"),
+        ("statement", 3, "y = 2;"),
+        ("statement", 5, "z = 3;"),
+    ]
+
+
+def test_default_argument_does_not_start_an_initializer(analyzer):
+    code = "void f(int x = 0) {\n    return;\n}\n"
+    found = [(c.kind, c.text, c.scope) for c in analyzer.analyze(code)]
+    assert found == [("block", "void f(int x = 0) {", ""), ("statement", "return;", "f")]
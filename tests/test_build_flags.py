@@ -0,0 +1,95 @@
+"""build_flags: the accepted spellings, and that anything else is refused before it reaches g++."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compiler import build_flags  # noqa: E402
+
+
+@pytest.mark.parametrize("opt, std, flags", [
+    (None, None, ()),
+    ("", "", ()),
+    ("-O0", None, ("-O0",)),
+    ("O2", None, ("-O2",)),
+    ("3", None, ("-O3",)),
+    (None, "c++17", ("-std=c++17",)),
+    (None, "20", ("-std=c++20",)),
+    (None, "-std=c++20", ("-std=c++20",)),
+    ("-O2", "c++17", ("-O2", "-std=c++17")),
+])
+def test_accepted(opt, std, flags):
+    assert build_flags(opt, std) == flags
+
+
+@pytest.mark.parametrize("opt, std", [
+    ("-O9", None),
+    ("-Ofast", None),
+    ("-O", None),
+    ("-O2 -fno-stack-protector", None),
+    ("-O2; rm -rf /", None),
+    (None, "c++98"),
+    (None, "gnu++17"),
+    (None, "c++20 -o /tmp/x"),
+])
+def test_unknown_values_are_refused(opt, std):
+    with pytest.raises(ValueError, match="Unknown"):
+        build_flags(opt, std)
+
+
+@pytest.mark.parametrize("opt, std", [
+    (2, None),
+    (["-O2"], None),
+    ({"level": "2"}, None),
+    (None, 17),
+    (None, True),
+    (None, ["c++20"]),
+])
+def test_non_strings_are_refused(opt, std):
+    # Straight from a JSON message; must be a clean ValueError, not an AttributeError
+    with pytest.raises(ValueError, match="must be a string"):
+        build_flags(opt, std)
+
+
+# --- how the endpoints report it ---
+
+@pytest.fixture(scope="module")
+def client():
+    pytest.importorskip("fastapi")
+    pytest.importorskip("httpx")
+    from fastapi.testclient import TestClient
+    import server
+    return TestClient(server.app)
+
+
+def test_compare_builds_validates_both_levels():
+    pytest.importorskip("fastapi")
+    import server
+    assert server.compare_builds({"opt": "O3", "compare": "-O0", "std": "17"}) == [
+        ("-O0", ("-O0", "-std=c++17")), ("-O3", ("-O3", "-std=c++17"))]
+    with pytest.raises(ValueError):
+        server.compare_builds({"compare": "-O7"})
+    with pytest.raises(ValueError):
+        server.compare_builds({"compare": 2})
+    with pytest.raises(ValueError, match="two different"):
+        server.compare_builds({"opt": "-O2", "compare": "O2"})
+
+
+@pytest.mark.parametrize("data", [{"opt": "-O9"}, {"opt": 3}, {"std": ["c++20"]}])
+def test_ws_run_reports_bad_flags(client, data):
+    with client.websocket_connect("/ws/run") as ws:
+        ws.send_json({"code": "int main(){}", **data})
+        assert ws.receive_text().startswith("Error: ")
+
+
+def test_session_replies_with_an_error_and_stays_open(client):
+    with client.websocket_connect("/ws/session") as ws:
+        ws.send_json({"id": 1, "type": "run", "code": "int main(){}", "std": ["c++20"]})
+        reply = ws.receive_json()
+        assert (reply["id"], reply["type"]) == (1, "error")
+        assert "must be a string" in reply["message"]
+        ws.send_json({"id": 2, "type": "run", "code": "int main(){}", "opt": "-O9"})
+        reply = ws.receive_json()
+        assert (reply["id"], reply["type"]) == (2, "error")
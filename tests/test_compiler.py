@@ -0,0 +1,156 @@
+"""CompileCache: hits and misses, concurrent builds of one key, eviction, and the cache directory itself."""
+import os
+import shutil
+import stat
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import compiler  # noqa: E402
+from compiler import CompileCache, private_dir  # noqa: E402
+
+needs_gxx = pytest.mark.skipif(os.name != "posix" or shutil.which("g++") is None,
+                               reason="needs g++")
+
+HELLO = '#include <cstdio>\nint main(){ puts("hi"); }'
+
+
+def program(n: int) -> str:
+    return f'#include <cstdio>\nint main(){{ printf("%d\\n", {n}); }}'
+
+
+def backdate(path: str, seconds: float):
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+def leftovers(cache: CompileCache):
+    # Anything but published binaries and their locks
+    return [n for n in os.listdir(cache.cache_dir) if not n.endswith((".exe", ".lock"))]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return CompileCache(str(tmp_path / "cache"), pch_sets=[])
+
+
+@needs_gxx
+def test_miss_then_hit(cache):
+    first = cache.compile(HELLO)
+    assert first.ok and not first.cached
+    assert first.exe == cache.path_for(cache.key(HELLO))
+    second = cache.compile(HELLO)
+    assert second.ok and second.cached
+    assert second.exe == first.exe
+    assert leftovers(cache) == []
+
+
+@needs_gxx
+def test_flags_and_source_are_part_of_the_key(cache):
+    assert cache.key(HELLO) != cache.key(HELLO, ["-O2"])
+    assert cache.key(HELLO) != cache.key(HELLO + "\n")
+    assert not cache.compile(HELLO).cached
+    assert not cache.compile(HELLO, ["-O2"]).cached
+    assert cache.compile(HELLO, ["-O2"]).cached
+
+
+@needs_gxx
+def test_failed_build_is_not_cached(cache):
+    result = cache.compile("int main(){ return x; }")
+    assert not result.ok and result.exe is None
+    assert "main.cpp:1:" in result.stderr  # built under a fixed name, not a cache path
+    assert not cache.compile("int main(){ return x; }").cached
+    assert leftovers(cache) == []
+
+
+@needs_gxx
+def test_concurrent_builds_of_one_key_compile_once(cache):
+    results = []
+    start = threading.Barrier(6)
+
+    def build():
+        start.wait()
+        results.append(cache.compile(program(1)))
+
+    threads = [threading.Thread(target=build) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert all(r.ok for r in results)
+    assert len({r.exe for r in results}) == 1
+    assert [r.cached for r in results].count(False) == 1
+    assert cache._locks == {}  # every per-key lock was dropped again
+    assert leftovers(cache) == []
+
+
+@needs_gxx
+def test_eviction_drops_least_recently_used(cache):
+    exes = [cache.compile(program(n)).exe for n in range(3)]
+    for age, exe in zip((300, 200, 100), exes):
+        backdate(exe, age + compiler.EVICTION_GRACE_SECONDS)
+    cache.compile(program(0))  # a hit makes the oldest the most recent
+
+    cache.max_bytes = os.path.getsize(exes[0]) * 2
+    cache._evict()
+    assert [os.path.exists(exe) for exe in exes] == [True, False, True]
+    assert not os.path.exists(exes[1][:-4] + ".lock")
+
+
+@needs_gxx
+def test_eviction_spares_recent_binaries(cache):
+    exes = [cache.compile(program(n)).exe for n in range(2)]
+    cache.max_bytes = 1
+    cache._evict()
+    # Over the cap, but another request may be about to run these
+    assert all(os.path.exists(exe) for exe in exes)
+
+
+def test_stale_build_dirs_are_removed(cache):
+    stale = os.path.join(cache.cache_dir, "0123456789abcdef.dead")
+    fresh = os.path.join(cache.cache_dir, "fedcba9876543210.busy")
+    os.makedirs(stale)
+    os.makedirs(fresh)
+    backdate(stale, compiler.EVICTION_GRACE_SECONDS + 10)
+    cache.remove_stale_builds()
+    assert not os.path.exists(stale)
+    assert os.path.exists(fresh)
+
+
+# --- the cache directory ---
+
+@pytest.mark.skipif(os.name != "posix", reason="POSIX permissions")
+def test_cache_dir_is_private(tmp_path):
+    cache = CompileCache(str(tmp_path / "new"), pch_sets=[])
+    assert stat.S_IMODE(os.stat(cache.cache_dir).st_mode) == compiler.PRIVATE_DIR_MODE
+
+
+@pytest.mark.skipif(os.name != "posix", reason="POSIX permissions")
+def test_private_dir_refuses_shared_or_odd_paths(tmp_path):
+    shared = tmp_path / "shared"
+    shared.mkdir()
+    shared.chmod(0o777)
+    with pytest.raises(PermissionError):
+        private_dir(str(shared))
+
+    not_a_dir = tmp_path / "file"
+    not_a_dir.write_text("")
+    with pytest.raises(OSError):  # FileExistsError from makedirs
+        private_dir(str(not_a_dir))
+
+    link = tmp_path / "link"
+    link.symlink_to(tmp_path / "elsewhere", target_is_directory=True)
+    (tmp_path / "elsewhere").mkdir()
+    with pytest.raises(PermissionError):
+        private_dir(str(link))
+
+
+def test_per_user_names():
+    if hasattr(os, "getuid"):
+        assert compiler.per_user("x") == f"x-{os.getuid()}"
+    assert os.path.basename(compiler.DEFAULT_CACHE_DIR).startswith("sensei-build-cache")
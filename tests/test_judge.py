@@ -0,0 +1,114 @@
+"""Judge verdicts, output normalization and diffs."""
+import os
+import shutil
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import judge  # noqa: E402
+import sandbox  # noqa: E402
+from compiler import CompileCache  # noqa: E402
+from sandbox import Usage  # noqa: E402
+
+
+def usage(returncode=0, cpu=0.01, wall=0.02, rss=2048, limit=None):
+    return Usage(returncode, cpu, wall, rss, limit)
+
+
+# --- normalize / diff ---
+
+def test_normalize_ignores_trailing_space_blank_lines_and_crlf():
+    assert judge.normalize("1 2  \r\n3\t\r\n\r\n\n") == ["1 2", "3"]
+    assert judge.normalize("") == []
+    assert judge.normalize("\n\n") == []
+
+
+def test_normalize_keeps_leading_space_and_inner_blank_lines():
+    assert judge.normalize("  a\n\nb") == ["  a", "", "b"]
+
+
+def test_diff_shows_the_changed_lines():
+    text = judge.diff("1\n2\n3\n", "1\n5\n3")
+    assert text.startswith("--- expected\n+++ output")
+    assert "-2" in text.splitlines() and "+5" in text.splitlines()
+
+
+def test_diff_is_empty_when_only_whitespace_differs():
+    assert judge.diff("a\nb\n", "a  \r\nb\n\n") == ""
+
+
+def test_diff_is_truncated():
+    expected = "\n".join(str(i) for i in range(200))
+    lines = judge.diff(expected, "").splitlines()
+    assert len(lines) == judge.MAX_DIFF_LINES + 1
+    assert lines[-1] == "..."
+
+
+# --- verdict ---
+
+@pytest.mark.parametrize("case, expected_verdict", [
+    (dict(output="3\n", expected="3"), "AC"),
+    (dict(output="3 \n\n", expected="3\n"), "AC"),
+    (dict(output="4\n", expected="3\n"), "WA"),
+    (dict(output="4\n", expected=None), "OK"),
+    (dict(u=usage(limit="wall"), output="3", expected="3"), "TLE"),
+    (dict(u=usage(returncode=-24, cpu=1.0, limit="cpu")), "TLE"),
+    (dict(u=usage(cpu=1.5), output="3", expected="3"), "TLE"),          # over the exact limit
+    (dict(u=usage(cpu=None, wall=1.5), output="3", expected="3"), "TLE"),  # wall where CPU isn't known
+    (dict(u=usage(rss=300 * 1024), output="3", expected="3"), "MLE"),
+    (dict(u=usage(returncode=-6), stderr="terminate called after throwing an instance of 'std::bad_alloc'"), "MLE"),
+    (dict(u=usage(returncode=-9, limit="output")), "OLE"),
+    (dict(u=usage(returncode=-11), output="3", expected="3"), "RE"),
+    (dict(u=usage(returncode=1), output="3", expected="3"), "RE"),
+])
+def test_verdict(case, expected_verdict):
+    got = judge.verdict(case.get("u", usage()), 1.0, 256, case.get("stderr", ""),
+                        case.get("output", ""), case.get("expected", "x"))
+    assert got == expected_verdict
+
+
+def test_case_limits_round_cpu_up_and_give_wall_headroom():
+    limits = judge.case_limits(1.5, 64, sandbox.Limits())
+    assert limits.cpu_seconds == 2
+    assert limits.wall_seconds == 4.5
+    assert limits.memory_bytes == 64 * 1024 * 1024
+    assert judge.case_limits(0.2, 64, sandbox.Limits()).cpu_seconds == 1
+
+
+# --- end to end ---
+
+needs_gxx = pytest.mark.skipif(os.name != "posix" or shutil.which("g++") is None,
+                               reason="needs g++ and the POSIX launcher")
+
+
+@pytest.fixture(scope="module")
+def build(tmp_path_factory):
+    cache = CompileCache(str(tmp_path_factory.mktemp("cache")), pch_sets=[])
+
+    def build(code: str) -> str:
+        result = cache.compile(code)
+        assert result.ok, result.stderr
+        return result.exe
+    return build
+
+
+SUM = '#include <iostream>\nint main(){ long a, b; std::cin >> a >> b; std::cout << a + b << "\\n"; }'
+
+
+@needs_gxx
+@pytest.mark.parametrize("code, stdin, expected, verdict", [
+    (SUM, "2 3", "5", "AC"),
+    (SUM, "2 3", "6", "WA"),
+    ('int main(){ volatile unsigned long x = 0; for (;;) x++; }', "", "", "TLE"),
+    ('#include <vector>\n#include <cstdio>\nint main(){ std::vector<char> v(512 << 20, 1); printf("%d", v[9]); }',
+     "", "1", "MLE"),
+    ('int main(){ int *p = nullptr; return *p; }', "", "", "RE"),
+    ('#include <cstdio>\nint main(){ for (;;) puts("spam"); }', "", "", "OLE"),
+])
+def test_run_case(build, code, stdin, expected, verdict):
+    base = sandbox.Limits(output_bytes=64 * 1024)
+    result = judge.run_case(0, build(code), stdin, expected, 1.0, 64, base)
+    assert result.verdict == verdict, result
+    assert (result.diff is not None) == (verdict == "WA")
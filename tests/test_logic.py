@@ -0,0 +1,143 @@
+"""
+SenseiLogic's keyword index and cache must give exactly what the original
+loop over the rule table gave. The reference below is that loop, unchanged.
+"""
+import glob
+import os
+import random
+import re
+import sys
+from typing import List, Optional, Tuple
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from logic import SenseiLogic  # noqa: E402
+
+
+class ReferenceLogic:
+    """The pre-index implementation: re.search every pattern, in order."""
+
+    def __init__(self, rules):
+        self.rules = rules
+
+    def explain_line(self, line: str) -> str:
+        line = line.strip()
+        if not line or line in ["{", "}", "};", "public:", "private:", "protected:"]:
+            if line in ["public:", "private:", "protected:"]:
+                pass
+            else:
+                return "..."
+
+        for pattern, summary, _, _ in self.rules:
+            match = re.search(pattern, line)
+            if match:
+                try:
+                    return summary.format(*match.groups())
+                except IndexError:
+                    return summary
+
+        return "Line analysis unsupported. (AI Explanation Available)"
+
+    def explain_more(self, line: str) -> Optional[Tuple[str, str]]:
+        line = line.strip()
+        for pattern, _, detail, url in self.rules:
+            match = re.search(pattern, line)
+            if match:
+                try:
+                    return (detail.format(*match.groups()), url)
+                except IndexError:
+                    return (detail, url)
+        return None
+
+    def get_options(self, line: str) -> List[str]:
+        return ['more'] if self.explain_more(line) else []
+
+
+def corpus_lines() -> List[str]:
+    lines = []
+    for path in sorted(glob.glob(os.path.join(ROOT, "benchmarks", "corpus", "*.cpp"))):
+        with open(path, encoding="utf-8") as f:
+            lines.extend(f.read().splitlines())
+    return lines
+
+
+# Pieces of C++ that the rules look for, plus near-misses (words that contain
+# a keyword, keywords without the expected punctuation, odd spacing)
+WORDS = [
+    "int", "double", "float", "char", "bool", "string", "std::string", "vector<int>", "map<int,int>",
+    "set<int>", "auto", "const", "static", "unsigned", "long", "void", "struct", "class", "enum",
+    "public:", "private:", "protected:", "virtual", "override", "new", "delete", "delete[]", "return",
+    "if", "else", "for", "while", "do", "switch", "case", "break", "continue", "cout", "cin", "endl",
+    "cerr", "#include", "<iostream>", "<vector>", "using", "namespace", "std", "main", "nullptr",
+    "true", "false", "printf", "scanf", "template", "typename", "try", "catch", "throw",
+    "x", "arr", "p", "ref", "total", "counter", "costly", "internal", "newValue", "returned", "coutput",
+    "=", "==", "+=", "++", "--", "<<", ">>", "&", "*", "->", "::", "(", ")", "{", "}", "[", "]",
+    "[10]", ";", ",", ":", "0", "1", "3.14", "'a'", '"hi"', "//", "/*", "*/", "{}", "{1, 2}",
+]
+
+
+def generated_lines(count: int = 3000, seed: int = 1) -> List[str]:
+    rng = random.Random(seed)
+    lines = []
+    for _ in range(count):
+        n = rng.randint(1, 8)
+        sep = rng.choice([" ", "", "  ", "\t"])
+        lines.append(rng.choice(["", " ", "    "]) + sep.join(rng.choice(WORDS) for _ in range(n)))
+    return lines
+
+
+LINES = corpus_lines() + generated_lines() + ["", "   ", "{", "}", "};", "public:", "private:", "protected:"]
+
+
+@pytest.fixture(params=[1024, 0, 8], ids=["cached", "uncached", "tiny-cache"])
+def logic(request):
+    return SenseiLogic(cache_size=request.param)
+
+
+def test_corpus_is_there():
+    assert len(corpus_lines()) > 50
+
+
+def test_matches_reference(logic):
+    reference = ReferenceLogic(logic.rules)
+    # Twice, so the second pass is answered from the cache where there is one
+    for _ in range(2):
+        for line in LINES:
+            assert logic.explain_line(line) == reference.explain_line(line), line
+            assert logic.explain_more(line) == reference.explain_more(line), line
+            assert logic.get_options(line) == reference.get_options(line), line
+
+
+def test_matches_reference_after_set_rules():
+    logic = SenseiLogic()
+    for line in LINES:
+        logic.explain_line(line)
+    # Reversed order changes which rule wins, so stale cache entries would show
+    logic.set_rules(list(reversed(logic.rules)))
+    reference = ReferenceLogic(logic.rules)
+    for line in LINES:
+        assert logic.explain_line(line) == reference.explain_line(line), line
+        assert logic.explain_more(line) == reference.explain_more(line), line
+
+
+# Patterns whose leading word is not required in every match
+ALTERNATION_RULES = [
+    (r'(foo)|bar', "FOO OR BAR: '{}'", "detail {}", "https://example.com/1"),
+    (r'foo\s+x|baz', "FOO X OR BAZ", "detail", "https://example.com/2"),
+    (r'(foo bar|qux)', "GROUPED: '{}'", "detail {}", "https://example.com/3"),
+    (r'(zap)?zip', "OPTIONAL: '{}'", "detail {}", "https://example.com/4"),
+    (r'\b(int)\s+(\w+)', "INT '{1}'", "detail {0}", "https://example.com/5"),
+]
+
+
+def test_matches_reference_with_alternation_rules():
+    logic = SenseiLogic()
+    logic.set_rules(ALTERNATION_RULES + logic.rules)
+    reference = ReferenceLogic(logic.rules)
+    for line in ["bar", "  bar = 1;", "foo", "baz", "foo   x", "qux", "foo bar", "zip", "zapzip", "int y"] + LINES:
+        assert logic.explain_line(line) == reference.explain_line(line), line
+        assert logic.explain_more(line) == reference.explain_more(line), line
+    assert logic.explain_line("bar") == "FOO OR BAR: 'None'"
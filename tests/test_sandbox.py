@@ -0,0 +1,149 @@
+"""Sandboxed runs: the limits, the usage numbers, and that nothing outlives a run."""
+import asyncio
+import os
+import shutil
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sandbox  # noqa: E402
+from compiler import CompileCache  # noqa: E402
+
+pytestmark = pytest.mark.skipif(os.name != "posix" or shutil.which("g++") is None,
+                                reason="needs g++ and the POSIX launcher")
+
+
+@pytest.fixture(scope="module")
+def build(tmp_path_factory):
+    cache = CompileCache(str(tmp_path_factory.mktemp("cache")), pch_sets=[])
+
+    def build(code: str) -> str:
+        result = cache.compile(code)
+        assert result.ok, result.stderr
+        return result.exe
+    return build
+
+
+def run(exe, stdin=b"", **limits):
+    with sandbox.scratch_dir() as workdir:
+        return sandbox.run(exe, sandbox.Limits(**limits), workdir, stdin)
+
+
+def gone(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    return False
+
+
+def test_output_exit_code_and_usage(build):
+    exe = build('#include <cstdio>\nint main(){ int a, b; scanf("%d %d", &a, &b); '
+                'printf("%d\\n", a + b); fprintf(stderr, "note\\n"); return 3; }')
+    out, err, usage = run(exe, b"2 40\n")
+    assert (out, err) == (b"42\n", b"note\n")
+    assert usage.returncode == 3
+    assert usage.limit is None
+    assert usage.cpu_seconds is not None and usage.cpu_seconds < 1
+    assert 0 < usage.wall_seconds < 5
+    assert usage.peak_rss_kb and usage.peak_rss_kb < 64 * 1024
+
+
+def test_peak_memory_is_the_programs_own(build):
+    exe = build('#include <cstring>\n#include <cstdlib>\n'
+                'int main(){ char *p = (char*)malloc(80 << 20); memset(p, 1, 80 << 20); return p[12345] - 1; }')
+    _, _, usage = run(exe)
+    assert usage.returncode == 0
+    assert 80 * 1024 <= usage.peak_rss_kb < 160 * 1024
+
+
+def test_cpu_limit(build):
+    exe = build('int main(){ volatile unsigned long x = 0; for (;;) x++; }')
+    _, _, usage = run(exe, cpu_seconds=1, wall_seconds=20)
+    assert usage.limit == "cpu"
+    assert usage.cpu_seconds >= 0.95
+    assert usage.wall_seconds < 10
+
+
+def test_wall_limit(build):
+    exe = build('#include <unistd.h>\nint main(){ sleep(60); }')
+    _, _, usage = run(exe, wall_seconds=1)
+    assert usage.limit == "wall"
+    assert 1 <= usage.wall_seconds < 5
+
+
+def test_wall_limit_covers_unread_stdin(build):
+    exe = build('#include <unistd.h>\nint main(){ sleep(60); }')
+    start = time.monotonic()
+    _, _, usage = run(exe, b"x" * (1 << 20), wall_seconds=1)
+    assert usage.limit == "wall"
+    assert time.monotonic() - start < 5
+
+
+def test_output_limit(build):
+    exe = build('#include <cstdio>\nint main(){ for (;;) puts("spam spam spam"); }')
+    out, _, usage = run(exe, output_bytes=10000, wall_seconds=20)
+    assert usage.limit == "output"
+    assert len(out) == 10000
+
+
+def test_memory_limit(build):
+    exe = build('#include <vector>\n#include <cstdio>\n'
+                'int main(){ std::vector<char> v(512 << 20, 1); printf("%d\\n", v[100]); }')
+    out, _, usage = run(exe, memory_bytes=128 * 1024 * 1024)
+    assert out == b""
+    assert usage.returncode != 0  # std::bad_alloc -> abort
+    assert usage.peak_rss_kb < 128 * 1024
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="only the Linux launcher is a subreaper")
+def test_children_that_escape_the_process_group_are_killed(build):
+    # setsid() takes the child out of the program's process group; it still holds stdout
+    exe = build('#include <cstdio>\n#include <unistd.h>\n'
+                'int main(){ pid_t pid = fork(); if (pid == 0) { setsid(); pause(); } '
+                'printf("%d\\n", (int)pid); return 0; }')
+    # In a thread, so a regression fails the test instead of hanging it
+    result = []
+    worker = threading.Thread(target=lambda: result.append(run(exe, wall_seconds=30)), daemon=True)
+    worker.start()
+    worker.join(5)
+    assert result, "run() still waiting on the escaped child"
+    out, _, usage = result[0]
+    assert usage.returncode == 0
+    child = int(out)
+    deadline = time.monotonic() + 2
+    while not gone(child) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert gone(child)
+
+
+def test_async_start_streams_and_reports(build):
+    exe = build('#include <iostream>\nint main(){ std::string name; std::cin >> name; '
+                'std::cout << "hi " << name << std::endl; }')
+
+    async def main():
+        with sandbox.scratch_dir() as workdir:
+            process = await sandbox.start(exe, sandbox.Limits(), workdir)
+            process.stdin.write(b"ada\n")
+            await process.stdin.drain()
+            out = await process.stdout.read()
+            await process.stderr.read()
+            return out, await process.wait()
+
+    out, usage = asyncio.run(main())
+    assert out == b"hi ada\n"
+    assert usage.returncode == 0 and usage.limit is None
+
+
+def test_kill_reports_the_limit(build):
+    exe = build('#include <unistd.h>\nint main(){ sleep(60); }')
+    with sandbox.scratch_dir() as workdir:
+        proc = sandbox.Run(exe, sandbox.Limits(), workdir)
+        proc.kill(limit="output")
+        usage = proc.wait()
+    assert usage.limit == "output"
+    assert usage.wall_seconds < 5